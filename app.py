@@ -12,28 +12,124 @@ import zipfile
 import datetime
 import pyttsx3
 import threading
+import time
 from werkzeug.utils import secure_filename
 from config import Config
+from llm_scheduler import LLMScheduler, INTERACTIVE, NORMAL, BACKGROUND
+from fake_backends import FakeGenerativeModel, FakeContextCache, FakeTranslator, FakeRecognizer
+from prefetch import Prefetcher
+from code_context import CodeContextStore
+from project_store import ProjectRegistry
+from blob_store import content_hash
+from profiler import SamplingProfiler
+import functools
+import hmac
 from github import Github
 import wave
 import audioop
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from flask import Response, stream_with_context, session
+import uuid
 
 app = Flask(__name__)
 app.config.from_object(Config)
 
 # Configure Google Gemini
-genai.configure(api_key=app.config['GEMINI_API_KEY'])
-model = genai.GenerativeModel(app.config['GEMINI_MODEL'])
+if app.config['FAKE_GEMINI']:
+    model = FakeGenerativeModel(latency=app.config['FAKE_GEMINI_LATENCY'],
+                                jitter=app.config['FAKE_GEMINI_JITTER'],
+                                tokens_per_second=app.config['FAKE_GEMINI_TOKENS_PER_SECOND'],
+                                rate_limit_rate=app.config['FAKE_GEMINI_429_RATE'],
+                                error_rate=app.config['FAKE_GEMINI_ERROR_RATE'])
+else:
+    genai.configure(api_key=app.config['GEMINI_API_KEY'])
+    model = genai.GenerativeModel(app.config['GEMINI_MODEL'])
+
+# On-demand sampling profiler, driven from the /admin/profile endpoints
+profiler = SamplingProfiler(interval=app.config['PROFILER_INTERVAL'])
+
+# All Gemini calls go through the scheduler for prioritisation and backpressure
+llm = LLMScheduler(model,
+                   profiler=profiler,
+                   max_concurrency=app.config['LLM_MAX_CONCURRENCY'],
+                   initial_concurrency=app.config['LLM_INITIAL_CONCURRENCY'],
+                   latency_target=app.config['LLM_LATENCY_TARGET'],
+                   max_retries=app.config['LLM_MAX_RETRIES'],
+                   breaker_threshold=app.config['LLM_BREAKER_THRESHOLD'],
+                   breaker_cooldown=app.config['LLM_BREAKER_COOLDOWN'],
+                   max_queued={NORMAL: app.config['LLM_MAX_QUEUED_NORMAL'],
+                               BACKGROUND: app.config['LLM_MAX_QUEUED_BACKGROUND']})
+
+# Per-session code contexts so the file is registered once, not resent with every prompt.
+# The pinned google-generativeai has no cached-content API, so provider caching
+# is only exercised against the fake backend.
+context_cache = FakeContextCache(model) if app.config['FAKE_GEMINI'] else None
+code_contexts = CodeContextStore(llm, context_cache,
+                                 max_tokens=app.config['CODE_CONTEXT_MAX_TOKENS'],
+                                 min_cache_tokens=app.config['CODE_CONTEXT_MIN_CACHE_TOKENS'],
+                                 cache_ttl=app.config['CODE_CONTEXT_CACHE_TTL'],
+                                 max_contexts=app.config['CODE_CONTEXT_MAX_ENTRIES'])
+
+# Speculative background analyses of freshly generated code
+prefetcher = Prefetcher(max_workers=app.config['PREFETCH_MAX_WORKERS'],
+                        max_entries=app.config['PREFETCH_MAX_ENTRIES'])
+
+# Shared pools so concurrent requests cannot multiply threads without limit
+multi_file_executor = ThreadPoolExecutor(max_workers=app.config['MULTI_FILE_MAX_WORKERS'])
+batch_executor = ThreadPoolExecutor(max_workers=app.config['BATCH_MAX_WORKERS'])
 
 # Initialize speech recognizer, translator, and TTS
-recognizer = sr.Recognizer()
-translator = Translator()
-tts_engine = pyttsx3.init()
+if app.config['FAKE_SPEECH']:
+    recognizer = FakeRecognizer(latency=app.config['FAKE_SPEECH_LATENCY'],
+                                error_rate=app.config['FAKE_SPEECH_ERROR_RATE'])
+    tts_engine = None
+else:
+    recognizer = sr.Recognizer()
+    tts_engine = pyttsx3.init()
+if app.config['FAKE_TRANSLATOR']:
+    translator = FakeTranslator(latency=app.config['FAKE_TRANSLATOR_LATENCY'],
+                                error_rate=app.config['FAKE_TRANSLATOR_ERROR_RATE'])
+else:
+    translator = Translator()
+
+# Project management (the current project is tracked per session).
+# Idle projects are spilled to disk to keep memory within budget.
+project_registry = ProjectRegistry(memory_budget=app.config['PROJECT_MEMORY_BUDGET'],
+                                   idle_seconds=app.config['PROJECT_IDLE_SECONDS'],
+                                   spill_dir=app.config['PROJECT_SPILL_DIR'])
+
+def spill_idle_projects():
+    """Background loop that moves idle projects to disk"""
+    while True:
+        time.sleep(app.config['PROJECT_SPILL_INTERVAL'])
+        try:
+            project_registry.spill_idle()
+        except Exception as e:
+            print(f"Project spill error: {e}")
+
+threading.Thread(target=spill_idle_projects, daemon=True).start()
+
+@app.before_request
+def start_request_profile():
+    # Admin calls (such as fetching the report) must not count against a requests=N budget
+    if profiler.active and not request.path.startswith('/admin/'):
+        profiler.begin_request(request.endpoint, request.url_rule.rule if request.url_rule else None)
 
-# Project management
-projects = {}
-current_project_id = None
-code_history = {}
+@app.teardown_request
+def end_request_profile(exc=None):
+    if profiler.active:
+        profiler.end_request()
+
+def require_admin(view):
+    """Only allow requests carrying the configured X-Admin-Token"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        token = app.config['ADMIN_TOKEN']
+        supplied = request.headers.get('X-Admin-Token', '')
+        if not token or not hmac.compare_digest(supplied.encode('utf-8'), token.encode('utf-8')):
+            return jsonify({'success': False, 'error': 'Forbidden'}), 403
+        return view(*args, **kwargs)
+    return wrapper
 
 @app.route('/')
 def index():
@@ -49,12 +145,13 @@ def generate_code():
         language = data.get('language', 'python')
         
         # Translate if not in English
-        try:
-            detected_lang = translator.detect(text).lang
-            if detected_lang != 'en':
-                text = translator.translate(text, dest='en').text
-        except Exception as e:
-            print(f"Translation error: {e}")
+        with profiler.span('translate'):
+            try:
+                detected_lang = translator.detect(text).lang
+                if detected_lang != 'en':
+                    text = translator.translate(text, dest='en').text
+            except Exception as e:
+                print(f"Translation error: {e}")
         
         # Generate code using Gemini
         prompt = f"""
@@ -66,7 +163,7 @@ def generate_code():
         Please provide clean, working code without any additional explanations.
         """
         
-        response = model.generate_content(prompt)
+        response = llm.generate(prompt, priority=INTERACTIVE)
         generated_code = response.text
         
         # Clean up the response - remove markdown code blocks if present
@@ -74,9 +171,15 @@ def generate_code():
             lines = generated_code.split('\n')
             generated_code = '\n'.join(lines[1:-1])
         
+        context = code_contexts.register(generated_code, language, session_id=get_session_id())
+        # Clients can opt out of prefetch, but only the operator can turn it on
+        if app.config['PREFETCH_ENABLED'] and data.get('prefetch', True):
+            prefetch_analyses(generated_code, language)
+        
         return jsonify({
             'success': True,
-            'code': generated_code
+            'code': generated_code,
+            'context_id': context.context_id
         })
         
     except Exception as e:
@@ -89,18 +192,15 @@ def generate_code():
 def modify_code():
     try:
         data = request.json
-        original_code = data.get('original_code', '')
+        context = resolve_code_context(data, code_key='original_code')
         selected_lines = data.get('selected_lines', '')
         line_start = data.get('line_start', 1)
         line_end = data.get('line_end', 1)
         modification = data.get('modification', '')
-        language = data.get('language', 'python')
-        
-        prompt = f"""
-        I have {language} code and need to modify specific lines.
+        language = context.language
         
-        Original code:
-        {original_code}
+        instruction = f"""
+        I need to modify specific lines of the code above.
         
         Selected lines ({line_start}-{line_end}):
         {selected_lines}
@@ -111,17 +211,22 @@ def modify_code():
         Keep the rest of the code unchanged. Return only the code without explanations.
         """
         
-        response = model.generate_content(prompt)
-        modified_code = response.text
+        # The model returns the whole file, so it must see all of it
+        modified_code = code_contexts.generate(context, instruction, INTERACTIVE, full_code=True)
         
         # Clean up the response
         if modified_code.startswith('```'):
             lines = modified_code.split('\n')
             modified_code = '\n'.join(lines[1:-1])
         
+        context = code_contexts.register(modified_code, language, session_id=get_session_id())
+        if app.config['PREFETCH_ENABLED'] and data.get('prefetch', True):
+            prefetch_analyses(modified_code, language)
+        
         return jsonify({
             'success': True,
-            'modified_code': modified_code
+            'modified_code': modified_code,
+            'context_id': context.context_id
         })
         
     except Exception as e:
@@ -148,15 +253,17 @@ def process_audio():
             
         try:
             # Try to recognize speech
-            transcript = recognizer.recognize_google(audio)
+            with profiler.span('speech.recognize'):
+                transcript = recognizer.recognize_google(audio)
             
             # Translate if needed
-            try:
-                detected_lang = translator.detect(transcript).lang
-                if detected_lang != 'en':
-                    transcript = translator.translate(transcript, dest='en').text
-            except:
-                pass  # Use original transcript if translation fails
+            with profiler.span('translate'):
+                try:
+                    detected_lang = translator.detect(transcript).lang
+                    if detected_lang != 'en':
+                        transcript = translator.translate(transcript, dest='en').text
+                except:
+                    pass  # Use original transcript if translation fails
             
         except sr.UnknownValueError:
             return jsonify({'success': False, 'error': 'Could not understand audio'})
@@ -186,7 +293,8 @@ def run_code():
         language = data.get('language', 'python')
         
         if language == 'python':
-            output, error = execute_python_code(code)
+            result = execute_python_code(code)
+            output, error = result['output'], result['error']
             return jsonify({
                 'success': True,
                 'output': output,
@@ -199,7 +307,8 @@ def run_code():
                 'error': None
             })
         elif language == 'java':
-            output, error = execute_java_code(code)
+            result = execute_java_code(code)
+            output, error = result['output'], result['error']
             return jsonify({
                 'success': True,
                 'output': output,
@@ -234,7 +343,8 @@ def format_code():
         code = data.get('code', '')
         language = data.get('language', 'python')
         
-        formatted_code = format_code_by_language(code, language)
+        with profiler.span('format'):
+            formatted_code = format_code_by_language(code, language)
         
         return jsonify({
             'success': True,
@@ -247,10 +357,9 @@ def format_code():
 def debug_code():
     try:
         data = request.json
-        code = data.get('code', '')
-        language = data.get('language', 'python')
+        context = resolve_code_context(data)
         
-        debug_info = analyze_code_for_debugging(code, language)
+        debug_info = analyze_code_for_debugging(context.code, context.language)
         
         return jsonify({
             'success': True,
@@ -263,20 +372,12 @@ def debug_code():
 def generate_description():
     try:
         data = request.json
-        code = data.get('code', '')
-        language = data.get('language', 'python')
+        context = resolve_code_context(data)
+        code, language = context.code, context.language
         
-        prompt = f"""
-        Provide a clear, concise description of what this {language} code does:
-        
-        {code}
-        
-        Explain in simple terms what the code accomplishes, its main functionality, 
-        and any important features. Keep it brief but informative.
-        """
-        
-        response = model.generate_content(prompt)
-        description = response.text
+        description = prefetcher.get('description', code, language,
+                                     lambda: generate_code_description(code, language),
+                                     owner=get_session_id())
         
         return jsonify({
             'success': True,
@@ -291,40 +392,146 @@ def create_multi_file_project():
         data = request.json
         description = data.get('description', '')
         language = data.get('language', 'python')
+        project_id = data.get('project_id')
+        stream = data.get('stream', False)
         
-        # Check if this should be a multi-file project
-        prompt = f"""
-        Analyze this project description and determine if it needs multiple files:
-        "{description}"
-        
-        Language: {language}
-        
-        If it needs multiple files, respond with JSON:
-        {{
-            "is_multi_file": true,
-            "files": [
-                {{"filename": "main.py", "content": "# Main file content"}},
-                {{"filename": "utils.py", "content": "# Utility functions"}}
-            ]
-        }}
-        
-        If it's a simple single-file project, respond with:
-        {{"is_multi_file": false}}
-        """
+        # Phase 1: small planning call for the file list and interfaces
+        plan = plan_multi_file_project(description, language)
+        if not plan.get('is_multi_file') or not plan.get('files'):
+            return jsonify({'success': True, 'project_data': {'is_multi_file': False}})
         
-        model = genai.GenerativeModel('gemini-pro')
-        response = model.generate_content(prompt)
+        if not project_id or project_id not in project_registry:
+            project_id = create_project_record(data.get('name', 'Untitled Project'), language)
         
-        try:
-            import json
-            project_data = json.loads(response.text.strip())
-            return jsonify({'success': True, 'project_data': project_data})
-        except:
-            return jsonify({'success': True, 'project_data': {'is_multi_file': False}})
+        # Phase 2: generate every planned file concurrently
+        results = generate_planned_files(project_id, description, language, plan)
+        
+        if stream:
+            def event_stream():
+                yield json.dumps({'event': 'plan', 'project_id': project_id, 'plan': plan}) + '\n'
+                for result in results:
+                    yield json.dumps(dict(result, event='file')) + '\n'
+                yield json.dumps({'event': 'done', 'project_id': project_id}) + '\n'
+            
+            return Response(stream_with_context(event_stream()), mimetype='application/x-ndjson')
+        
+        files = list(results)
+        return jsonify({
+            'success': True,
+            'project_id': project_id,
+            'project_data': {
+                'is_multi_file': True,
+                'files': [{'filename': f['filename'], 'content': f.get('content', '')} for f in files if f['success']],
+                'errors': [f for f in files if not f['success']]
+            }
+        })
             
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
+def plan_multi_file_project(description, language):
+    """Ask the model for the file list and interfaces only, without file contents"""
+    prompt = f"""
+    Analyze this project description and determine if it needs multiple files:
+    "{description}"
+    
+    Language: {language}
+    
+    Do NOT write the file contents. If it needs multiple files, respond with JSON only:
+    {{
+        "is_multi_file": true,
+        "files": [
+            {{"filename": "main.py", "purpose": "Entry point", "interface": "def main() -> None"}},
+            {{"filename": "utils.py", "purpose": "Helpers", "interface": "def load(path: str) -> dict"}}
+        ]
+    }}
+    
+    If it's a simple single-file project, respond with:
+    {{"is_multi_file": false}}
+    """
+    
+    response = llm.generate(prompt, priority=BACKGROUND)
+    try:
+        plan = json.loads(clean_code_response(response.text))
+    except ValueError:
+        return {'is_multi_file': False}
+    
+    if not isinstance(plan, dict):
+        return {'is_multi_file': False}
+    
+    files = plan.get('files') or []
+    if not isinstance(files, list):
+        files = []
+    
+    # Filenames come from the model: keep only safe, distinct relative paths
+    planned, seen = [], set()
+    for file_plan in files:
+        if not isinstance(file_plan, dict):
+            continue
+        filename = safe_project_filename(file_plan.get('filename'))
+        if filename and filename not in seen:
+            seen.add(filename)
+            planned.append(dict(file_plan, filename=filename))
+    plan['files'] = planned[:app.config['MULTI_FILE_MAX_FILES']]
+    return plan
+
+def safe_project_filename(filename):
+    """Normalize a relative project path segment by segment; None if nothing safe is left"""
+    if not isinstance(filename, str):
+        return None
+    parts = [secure_filename(part) for part in filename.replace('\\', '/').split('/')]
+    parts = [part for part in parts if part]
+    return '/'.join(parts) or None
+
+def generate_planned_files(project_id, description, language, plan):
+    """Generate each planned file on the shared pool, yielding results as they finish"""
+    interfaces = '\n'.join(
+        f"- {f['filename']}: {f.get('purpose', '')} | {f.get('interface', '')}" for f in plan['files']
+    )
+    
+    def generate_file(file_plan):
+        filename = file_plan['filename']
+        prompt = f"""
+        You are writing one file of a multi-file {language} project.
+        
+        Project description: {description}
+        
+        All files in the project and their interfaces:
+        {interfaces}
+        
+        Write the complete contents of {filename} ({file_plan.get('purpose', '')}).
+        Implement exactly this interface: {file_plan.get('interface', '')}
+        Import from the other files using the interfaces above.
+        Return only the code without explanations.
+        """
+        response = llm.generate(prompt, priority=BACKGROUND)
+        content = clean_code_response(response.text)
+        add_file_to_project(project_id, filename, content, language)
+        return content
+    
+    futures = {multi_file_executor.submit(generate_file, f): f['filename'] for f in plan['files']}
+    try:
+        for future in as_completed(futures):
+            filename = futures[future]
+            try:
+                yield {'success': True, 'filename': filename, 'content': future.result()}
+            except Exception as e:
+                yield {'success': False, 'filename': filename, 'error': str(e)}
+    finally:
+        # Drop files that have not started if the client went away
+        for future in futures:
+            future.cancel()
+
+def clean_code_response(text):
+    """Strip markdown code fences from a model response"""
+    text = text.strip()
+    if text.startswith('```'):
+        lines = text.split('\n')
+        if lines[-1].strip() == '```':
+            lines = lines[:-1]
+        text = '\n'.join(lines[1:])
+    return text
+
 def execute_python_code(code):
     try:
         # Simple Python execution (in production, use a proper sandbox)
@@ -336,7 +543,7 @@ def execute_python_code(code):
         stdout_capture = io.StringIO()
         stderr_capture = io.StringIO()
         
-        with redirect_stdout(stdout_capture), redirect_stderr(stderr_capture):
+        with profiler.span('execute'), redirect_stdout(stdout_capture), redirect_stderr(stderr_capture):
             exec(code)
         
         output = stdout_capture.getvalue()
@@ -391,10 +598,8 @@ def format_code_by_language(code, language):
 
 def analyze_code_for_debugging(code, language):
     try:
-        prompt = f"""
-        Analyze this {language} code for potential bugs, errors, and improvements:
-        
-        {code}
+        instruction = f"""
+        Analyze the {language} code above for potential bugs, errors, and improvements.
         
         Provide a detailed analysis including:
         1. Syntax errors (if any)
@@ -406,11 +611,85 @@ def analyze_code_for_debugging(code, language):
         Format as a structured analysis with clear sections.
         """
         
-        response = model.generate_content(prompt)
-        return response.text
+        context = code_contexts.register(code, language)
+        return code_contexts.generate(context, instruction, NORMAL)
     except Exception as e:
         return f"Debug analysis failed: {str(e)}"
 
+def generate_code_explanation(code, language, priority=INTERACTIVE):
+    """Ask the model for a beginner-friendly explanation of the code"""
+    instruction = f"""
+    Explain the {language} code above in simple terms.
+    
+    Provide a clear, beginner-friendly explanation of what this code does,
+    how it works, and any important concepts involved.
+    """
+    
+    context = code_contexts.register(code, language)
+    return code_contexts.generate(context, instruction, priority)
+
+def detect_code_bugs(code, language, priority=BACKGROUND):
+    """Ask the model for potential bugs and suggested fixes"""
+    instruction = f"""
+    Analyze the {language} code above for potential bugs, errors, or improvements.
+    
+    Provide:
+    1. List of potential bugs or issues
+    2. Suggested fixes for each issue
+    3. Code quality improvements
+    4. Best practice recommendations
+    
+    Format your response as JSON with 'issues' and 'suggestions' arrays.
+    """
+    
+    context = code_contexts.register(code, language)
+    return code_contexts.generate(context, instruction, priority)
+
+def generate_code_description(code, language, priority=BACKGROUND):
+    """Ask the model for a short description of what the code does"""
+    instruction = f"""
+    Provide a clear, concise description of what the {language} code above does.
+    
+    Explain in simple terms what the code accomplishes, its main functionality, 
+    and any important features. Keep it brief but informative.
+    """
+    
+    context = code_contexts.register(code, language)
+    return code_contexts.generate(context, instruction, priority)
+
+def prefetch_analyses(code, language):
+    """Queue low-priority explain/bugs/description jobs for code the user will likely ask about next"""
+    prefetcher.schedule(get_session_id(), code, language, {
+        'explain': lambda c, l: generate_code_explanation(c, l, priority=BACKGROUND),
+        'bugs': lambda c, l: detect_code_bugs(c, l, priority=BACKGROUND),
+        'description': lambda c, l: generate_code_description(c, l, priority=BACKGROUND),
+    })
+
+def resolve_code_context(data, code_key='code', track_session=True):
+    """Register the code sent with a request, or look up the context it refers to.
+
+    With track_session, registered code becomes the session's current context.
+    """
+    language = data.get('language', 'python')
+    if code_key in data:
+        return code_contexts.register(data.get(code_key) or '', language,
+                                      session_id=get_session_id() if track_session else None)
+    
+    context_id = data.get('context_id')
+    if context_id:
+        context = code_contexts.get(context_id)
+    else:
+        context = code_contexts.current(get_session_id())
+    if context is None:
+        raise ValueError('Code context not found, please send the code again')
+    return context
+
+def get_session_id():
+    """Stable per-browser-session identifier"""
+    if 'sid' not in session:
+        session['sid'] = uuid.uuid4().hex
+    return session['sid']
+
 def get_file_extension(language):
     """Get appropriate file extension for programming language"""
     extensions = {
@@ -438,6 +717,189 @@ def get_file_extension(language):
     }
     return extensions.get(language, '.txt')
 
+# Batch operation name -> (response key, handler(code, language)).
+# Prefetch lookups pass no owner so a batch never retargets the session's prefetches.
+BATCH_OPERATIONS = {
+    'explain': ('explanation', lambda code, language: prefetcher.get(
+        'explain', code, language, lambda: generate_code_explanation(code, language))),
+    'bugs': ('analysis', lambda code, language: prefetcher.get(
+        'bugs', code, language, lambda: detect_code_bugs(code, language))),
+    'description': ('description', lambda code, language: prefetcher.get(
+        'description', code, language, lambda: generate_code_description(code, language))),
+    'format': ('formatted_code', lambda code, language: format_code_by_language(code, language)),
+    'debug': ('debug_info', lambda code, language: analyze_code_for_debugging(code, language)),
+}
+
+@app.route('/batch', methods=['POST'])
+def batch():
+    try:
+        data = request.json
+        operations = data.get('operations') or []
+        buffers = data.get('buffers') or {}
+        stream = data.get('stream', False)
+        max_timeout = app.config['BATCH_OP_TIMEOUT']
+        
+        if not isinstance(operations, list) or not isinstance(buffers, dict):
+            return jsonify({'success': False, 'error': 'operations must be a list and buffers an object'})
+        if len(operations) > app.config['BATCH_MAX_OPERATIONS']:
+            return jsonify({'success': False,
+                            'error': f"At most {app.config['BATCH_MAX_OPERATIONS']} operations per batch"})
+        
+        # Resolve every operation to a registered context up front, in the request context
+        jobs, requested, errors = {}, [], []
+        for index, operation in enumerate(operations):
+            op_id, op = index, None
+            try:
+                if not isinstance(operation, dict):
+                    raise ValueError('Operation must be an object')
+                op_id = operation.get('id', index)
+                op = operation.get('op')
+                if op not in BATCH_OPERATIONS:
+                    raise ValueError(f'Unknown operation: {op}')
+                timeout = operation.get('timeout')
+                timeout = max_timeout if timeout is None else float(timeout)
+                if not timeout > 0:
+                    raise ValueError('Operation timeout must be a positive number')
+                timeout = min(timeout, max_timeout)
+                # Batch buffers must not replace the session's current code
+                if 'buffer' in operation:
+                    if not isinstance(buffers.get(operation['buffer']), dict):
+                        raise ValueError(f"Unknown buffer: {operation['buffer']}")
+                    context = resolve_code_context(buffers[operation['buffer']], track_session=False)
+                else:
+                    context = resolve_code_context(operation, track_session=False)
+            except Exception as e:
+                errors.append({'id': op_id, 'op': op, 'success': False, 'error': str(e)})
+                continue
+            
+            # Identical sub-requests share one job; the tightest timeout wins
+            key = (op, context.context_id)
+            if key in jobs:
+                jobs[key] = (jobs[key][0], min(jobs[key][1], timeout))
+            else:
+                _, handler = BATCH_OPERATIONS[op]
+                jobs[key] = (functools.partial(handler, context.code, context.language), timeout)
+            requested.append((op_id, key))
+        
+        def results():
+            for error in errors:
+                yield error
+            ids_by_key = {}
+            for op_id, key in requested:
+                ids_by_key.setdefault(key, []).append(op_id)
+            for (op, context_id), outcome in run_batch_jobs(jobs):
+                result_key, _ = BATCH_OPERATIONS[op]
+                if outcome['success']:
+                    outcome = {'success': True, result_key: outcome['result']}
+                for op_id in ids_by_key[(op, context_id)]:
+                    yield dict(outcome, id=op_id, op=op, context_id=context_id)
+        
+        summary = {'operations': len(operations), 'unique': len(jobs), 'deduplicated': len(requested) - len(jobs)}
+        
+        if stream:
+            def event_stream():
+                for result in results():
+                    yield json.dumps(dict(result, event='result')) + '\n'
+                yield json.dumps(dict(summary, event='done')) + '\n'
+            
+            return Response(stream_with_context(event_stream()), mimetype='application/x-ndjson')
+        
+        # Completion order is kept so clients can tell which operations were slow
+        return jsonify(dict(summary, success=True, results=list(results())))
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+def run_batch_jobs(jobs):
+    """Run {key: (fn, timeout)} concurrently, yielding (key, outcome) as each finishes or times out.
+
+    A timed-out job is cancelled if it has not started; one already running
+    finishes in the background and its result is discarded.
+    """
+    pending = {}
+    for key, (fn, timeout) in jobs.items():
+        pending[batch_executor.submit(fn)] = (key, time.monotonic() + timeout)
+    
+    while pending:
+        next_deadline = min(deadline for _, deadline in pending.values())
+        done, _ = wait(pending, timeout=max(0, next_deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+        for future in done:
+            key, _ = pending.pop(future)
+            try:
+                yield key, {'success': True, 'result': future.result()}
+            except Exception as e:
+                yield key, {'success': False, 'error': str(e)}
+        
+        now = time.monotonic()
+        for future, (key, deadline) in list(pending.items()):
+            if deadline <= now:
+                del pending[future]
+                future.cancel()
+                yield key, {'success': False, 'error': 'Operation timed out', 'timed_out': True}
+
+@app.route('/register_context', methods=['POST'])
+def register_context():
+    try:
+        data = request.json
+        context = resolve_code_context(data)
+        
+        return jsonify({
+            'success': True,
+            'context': context.to_dict()
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+@app.route('/metrics')
+def metrics():
+    try:
+        return jsonify({
+            'success': True,
+            'llm': llm.stats(),
+            'prefetch': prefetcher.stats(),
+            'code_context': code_contexts.stats(),
+            'projects': project_registry.stats()
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+@app.route('/admin/profile/start', methods=['POST'])
+@require_admin
+def start_profile():
+    try:
+        data = request.json or {}
+        duration = data.get('duration')
+        requests_to_profile = data.get('requests')
+        if not duration and not requests_to_profile:
+            duration = 30
+        
+        profiler.start(duration=duration, route=data.get('route'),
+                       requests=requests_to_profile, interval=data.get('interval'))
+        
+        return jsonify({'success': True, 'profile': profiler.report(top=0)})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+@app.route('/admin/profile/stop', methods=['POST'])
+@require_admin
+def stop_profile():
+    try:
+        profiler.stop()
+        return jsonify({'success': True, 'profile': profiler.report()})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+@app.route('/admin/profile/report')
+@require_admin
+def profile_report():
+    try:
+        if request.args.get('format') == 'collapsed':
+            # Feed to flamegraph.pl or speedscope
+            return Response(profiler.collapsed(), mimetype='text/plain')
+        
+        return jsonify({'success': True, 'profile': profiler.report(top=int(request.args.get('top', 50)))})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
 @app.route('/create_project', methods=['POST'])
 def create_project():
     try:
@@ -445,23 +907,12 @@ def create_project():
         project_name = data.get('name', 'Untitled Project')
         language = data.get('language', 'python')
         
-        project_id = f"project_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}"
-        
-        projects[project_id] = {
-            'name': project_name,
-            'language': language,
-            'files': {},
-            'created_at': datetime.datetime.now().isoformat(),
-            'readme': ''
-        }
-        
-        global current_project_id
-        current_project_id = project_id
+        project_id = create_project_record(project_name, language)
         
         return jsonify({
             'success': True,
             'project_id': project_id,
-            'project': projects[project_id]
+            'project': project_registry.get(project_id, with_content=True)
         })
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
@@ -470,96 +921,100 @@ def create_project():
 def add_file():
     try:
         data = request.json
-        project_id = data.get('project_id', current_project_id)
+        project_id = data.get('project_id', session.get('current_project_id'))
         filename = data.get('filename', '')
         content = data.get('content', '')
         language = data.get('language', 'python')
         
-        if not project_id or project_id not in projects:
+        if not project_id or project_id not in project_registry:
             return jsonify({'success': False, 'error': 'Invalid project'})
         
-        if not filename:
-            # Auto-generate filename based on language
-            base_name = f"main{get_file_extension(language)}"
-            counter = 1
-            while base_name in projects[project_id]['files']:
-                base_name = f"file{counter}{get_file_extension(language)}"
-                counter += 1
-            filename = base_name
-        
-        projects[project_id]['files'][filename] = {
-            'content': content,
-            'created_at': datetime.datetime.now().isoformat(),
-            'language': language
-        }
-        
-        # Save to history
-        if project_id not in code_history:
-            code_history[project_id] = []
-        
-        code_history[project_id].append({
-            'timestamp': datetime.datetime.now().isoformat(),
-            'action': 'add_file',
-            'filename': filename,
-            'content': content
-        })
+        filename, _ = project_registry.add_file(project_id, filename, content, language,
+                                                default_filename=default_filename_for(language))
         
         return jsonify({
             'success': True,
             'filename': filename,
-            'project': projects[project_id]
+            'project': project_registry.get(project_id, with_content=True)
         })
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
+def create_project_record(project_name, language):
+    """Create an empty project and make it the session's current one"""
+    project_id, _ = project_registry.create(project_name, language)
+    session['current_project_id'] = project_id
+    return project_id
+
+def add_file_to_project(project_id, filename, content, language):
+    """Store a file in a project and record it in the code history"""
+    filename, _ = project_registry.add_file(project_id, filename, content, language,
+                                            default_filename=default_filename_for(language))
+    return filename
+
+def default_filename_for(language):
+    """Auto-generate a free filename based on language"""
+    def pick(files):
+        base_name = f"main{get_file_extension(language)}"
+        counter = 1
+        while base_name in files:
+            base_name = f"file{counter}{get_file_extension(language)}"
+            counter += 1
+        return base_name
+    return pick
+
 @app.route('/export_project/<project_id>')
 def export_project(project_id):
     try:
-        if project_id not in projects:
+        # Snapshot is immutable, no lock needed while exporting
+        project = project_registry.get(project_id, with_content=True)
+        if project is None:
             return jsonify({'success': False, 'error': 'Project not found'})
         
-        project = projects[project_id]
+        if not project['files']:
+            return jsonify({'success': False, 'error': 'Project has no files'})
         
         # Single file export
         if len(project['files']) == 1:
             filename, file_data = next(iter(project['files'].items()))
-            
+            return send_file(
+                BytesIO(file_data['content'].encode('utf-8')),
+                mimetype='text/plain',
+                as_attachment=True,
+                download_name=filename,
+                etag=file_data['hash']
+            )
+        
+        # Multi-file export as ZIP with README and project structure
+        # Entries are stamped with the project's own timestamps (not the export time),
+        # so the archive bytes depend only on what the ETag manifest covers
+        zip_buffer = BytesIO()
         with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-            for filename, content in files.items():
-                zip_file.writestr(filename, content)
-            
-            # Add console output if available
-            if console_output:
-                zip_file.writestr('console_output.txt', console_output)
-            
-            # Add code description if available
-            if code_description:
-                zip_file.writestr('code_description.txt', code_description)
+            for filename, file_data in project['files'].items():
+                zip_file.writestr(zip_entry(filename, file_data['created_at']), file_data['content'])
             
-            # Add README
-            readme_content = f"""# {project_name}
-
-Generated by V2C (Voice-to-Code) AI Assistant
-
-## Files
-{chr(10).join([f"- {filename}" for filename in files.keys()])}
-
-## Additional Files
-- console_output.txt: Console execution output
-- code_description.txt: AI-generated code description
-
-## Usage
-This project was created using voice commands and AI assistance.
-"""
-            zip_file.writestr('README.md', readme_content)
+            zip_file.writestr(zip_entry('README.md', project['created_at']),
+                              project['readme'] or generate_readme(project))
+            zip_file.writestr(zip_entry('PROJECT_STRUCTURE.md', project['created_at']),
+                              generate_project_structure(project))
         
         zip_buffer.seek(0)
         
+        # Contents are hashed already, so the ETag hashes the manifest of everything else the archive uses
+        manifest = json.dumps({
+            'name': project['name'],
+            'language': project['language'],
+            'created_at': project['created_at'],
+            'readme': project['readme'],
+            'files': [[filename, file_data['hash'], file_data['created_at'], file_data['language']]
+                      for filename, file_data in project['files'].items()]
+        })
         return send_file(
-            BytesIO(zip_buffer.read()),
+            zip_buffer,
             mimetype='application/zip',
             as_attachment=True,
-            download_name=f'{project_name}.zip'
+            download_name=f"{secure_filename(project['name']) or 'project'}.zip",
+            etag=content_hash(manifest)
         )
         
     except Exception as e:
@@ -568,10 +1023,10 @@ This project was created using voice commands and AI assistance.
 @app.route('/get_history/<project_id>')
 def get_history(project_id):
     try:
-        history = code_history.get(project_id, [])
+        history = project_registry.history(project_id, with_content=True, last=10)  # Last 10 versions
         return jsonify({
             'success': True,
-            'history': history[-10:]  # Last 10 versions
+            'history': list(history)
         })
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
@@ -580,28 +1035,22 @@ def get_history(project_id):
 def rollback():
     try:
         data = request.json
-        project_id = data.get('project_id', current_project_id)
+        project_id = data.get('project_id', session.get('current_project_id'))
         version_index = data.get('version_index', -1)
         
-        if project_id not in code_history:
+        if not project_registry.history(project_id):
             return jsonify({'success': False, 'error': 'No history found'})
         
-        history = code_history[project_id]
-        if version_index >= len(history) or version_index < 0:
-            return jsonify({'success': False, 'error': 'Invalid version'})
-        
         # Restore to selected version
-        version = history[version_index]
-        filename = version['filename']
-        content = version['content']
-        
-        if project_id in projects and filename in projects[project_id]['files']:
-            projects[project_id]['files'][filename]['content'] = content
+        try:
+            version = project_registry.rollback(project_id, version_index)
+        except IndexError:
+            return jsonify({'success': False, 'error': 'Invalid version'})
         
         return jsonify({
             'success': True,
-            'restored_content': content,
-            'filename': filename
+            'restored_content': version['content'],
+            'filename': version['filename']
         })
         
     except Exception as e:
@@ -611,21 +1060,13 @@ def rollback():
 def explain_code():
     try:
         data = request.json
-        code = data.get('code', '')
-        language = data.get('language', 'python')
+        context = resolve_code_context(data)
+        code, language = context.code, context.language
         audio_output = data.get('audio_output', False)
         
-        prompt = f"""
-        Explain the following {language} code in simple terms:
-        
-        {code}
-        
-        Provide a clear, beginner-friendly explanation of what this code does,
-        how it works, and any important concepts involved.
-        """
-        
-        response = model.generate_content(prompt)
-        explanation = response.text
+        explanation = prefetcher.get('explain', code, language,
+                                     lambda: generate_code_explanation(code, language),
+                                     owner=get_session_id())
         
         # Generate audio if requested
         audio_file = None
@@ -645,25 +1086,12 @@ def explain_code():
 def detect_bugs():
     try:
         data = request.json
-        code = data.get('code', '')
-        language = data.get('language', 'python')
-        
-        prompt = f"""
-        Analyze the following {language} code for potential bugs, errors, or improvements:
-        
-        {code}
+        context = resolve_code_context(data)
+        code, language = context.code, context.language
         
-        Provide:
-        1. List of potential bugs or issues
-        2. Suggested fixes for each issue
-        3. Code quality improvements
-        4. Best practice recommendations
-        
-        Format your response as JSON with 'issues' and 'suggestions' arrays.
-        """
-        
-        response = model.generate_content(prompt)
-        analysis = response.text
+        analysis = prefetcher.get('bugs', code, language,
+                                  lambda: detect_code_bugs(code, language),
+                                  owner=get_session_id())
         
         return jsonify({
             'success': True,
@@ -720,14 +1148,16 @@ def voice_command():
             })
         elif 'run' in command:
             if language == 'python':
-                output, error = execute_python_code(code)
+                result = execute_python_code(code)
+                output, error = result['output'], result['error']
                 return jsonify({
                     'success': True,
                     'output': output,
                     'error': error
                 })
             elif language == 'java':
-                output, error = execute_java_code(code)
+                result = execute_java_code(code)
+                output, error = result['output'], result['error']
                 return jsonify({
                     'success': True,
                     'output': output,
@@ -752,6 +1182,12 @@ def voice_command():
             'error': str(e)
         })
 
+def zip_entry(filename, timestamp):
+    """ZipInfo for an archive member dated by an ISO timestamp"""
+    info = zipfile.ZipInfo(filename, date_time=datetime.datetime.fromisoformat(timestamp).timetuple()[:6])
+    info.compress_type = zipfile.ZIP_DEFLATED
+    return info
+
 def generate_readme(project):
     """Generate README content for project"""
     files_list = '\n'.join([f"- {filename}" for filename in project['files'].keys()])
@@ -0,0 +1,274 @@
+"""Load test for app.py against local fakes of Gemini, googletrans and speech recognition.
+
+Example:
+    python benchmark.py --concurrency 16 --duration 30 --gemini-latency 0.8 --output bench.json
+    python benchmark.py --compare bench.json
+"""
+import argparse
+import datetime
+import io
+import json
+import logging
+import math
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+import wave
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='V2C end-to-end load benchmark')
+    parser.add_argument('--concurrency', type=int, default=8, help='virtual users running workflows in parallel')
+    parser.add_argument('--duration', type=float, default=20.0, help='seconds to keep starting new workflows')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--gemini-latency', type=float, default=0.5, help='fake Gemini base latency (s)')
+    parser.add_argument('--gemini-jitter', type=float, default=0.2, help='extra random fake Gemini latency (s)')
+    parser.add_argument('--tokens-per-second', type=float, default=200.0, help='fake Gemini output token rate')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='fraction of Gemini calls answered 429')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of Gemini calls that fail')
+    parser.add_argument('--translator-latency', type=float, default=0.1)
+    parser.add_argument('--translator-error-rate', type=float, default=0.0)
+    parser.add_argument('--speech-latency', type=float, default=0.3)
+    parser.add_argument('--speech-error-rate', type=float, default=0.0)
+    parser.add_argument('--prefetch', action='store_true', help='enable speculative prefetch in the app')
+    parser.add_argument('--output', help='write machine-readable results to this JSON file')
+    parser.add_argument('--compare', help='baseline JSON results to compare against')
+    return parser.parse_args()
+
+
+def configure_fakes(args):
+    """Point the app at the local fakes; must run before app is imported"""
+    os.environ.update({
+        'FAKE_GEMINI': '1',
+        'FAKE_GEMINI_LATENCY': str(args.gemini_latency),
+        'FAKE_GEMINI_JITTER': str(args.gemini_jitter),
+        'FAKE_GEMINI_TOKENS_PER_SECOND': str(args.tokens_per_second),
+        'FAKE_GEMINI_429_RATE': str(args.rate_limit_rate),
+        'FAKE_GEMINI_ERROR_RATE': str(args.error_rate),
+        'FAKE_TRANSLATOR': '1',
+        'FAKE_TRANSLATOR_LATENCY': str(args.translator_latency),
+        'FAKE_TRANSLATOR_ERROR_RATE': str(args.translator_error_rate),
+        'FAKE_SPEECH': '1',
+        'FAKE_SPEECH_LATENCY': str(args.speech_latency),
+        'FAKE_SPEECH_ERROR_RATE': str(args.speech_error_rate),
+        'PREFETCH_ENABLED': '1' if args.prefetch else '',
+    })
+
+
+def start_server():
+    """Run the Flask app on a free local port in a background thread"""
+    from werkzeug.serving import make_server
+    import app as v2c
+
+    # Per-request access logs would swamp the report
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, v2c.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+
+def silent_wav(seconds=1.0, rate=16000):
+    """A short silent WAV so /process_audio exercises the real upload path"""
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(b'\0\0' * int(seconds * rate))
+    return buffer.getvalue()
+
+
+class Recorder:
+    """Thread-safe collection of per-endpoint samples"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}
+
+    def add(self, endpoint, latency, ok, app_ok):
+        with self._lock:
+            self.samples.setdefault(endpoint, []).append((latency, ok, app_ok))
+
+
+def timed(recorder, session, endpoint, method, url, **kwargs):
+    start = time.perf_counter()
+    try:
+        response = session.request(method, url, timeout=120, **kwargs)
+    except Exception:
+        recorder.add(endpoint, time.perf_counter() - start, False, False)
+        return None
+    latency = time.perf_counter() - start
+    app_ok = response.ok
+    if response.ok and response.headers.get('Content-Type', '').startswith('application/json'):
+        app_ok = bool(response.json().get('success', True))
+    recorder.add(endpoint, latency, response.ok, app_ok)
+    return response
+
+
+def run_workflow(base, recorder, rng, audio):
+    """One realistic session: speak, generate, modify, analyse, run, save, export"""
+    import requests
+
+    session = requests.Session()
+    language = rng.choice(['python', 'python', 'javascript'])
+
+    response = timed(recorder, session, '/create_project', 'POST', f'{base}/create_project',
+                     json={'name': 'Benchmark', 'language': language})
+    project_id = response.json().get('project_id') if response is not None and response.ok else None
+
+    timed(recorder, session, '/process_audio', 'POST', f'{base}/process_audio',
+          files={'audio': ('speech.wav', audio, 'audio/wav')})
+
+    response = timed(recorder, session, '/generate_code', 'POST', f'{base}/generate_code',
+                     json={'text': 'create a function that adds two numbers', 'language': language})
+    code = response.json().get('code', '') if response is not None and response.ok else ''
+
+    response = timed(recorder, session, '/modify_code', 'POST', f'{base}/modify_code',
+                     json={'original_code': code, 'selected_lines': code.split('\n')[0],
+                           'line_start': 1, 'line_end': 1,
+                           'modification': 'rename the function to add', 'language': language})
+    if response is not None and response.ok:
+        code = response.json().get('modified_code', code)
+
+    for endpoint in rng.sample(['/explain_code', '/detect_bugs', '/generate_description', '/debug_code'], 2):
+        timed(recorder, session, endpoint, 'POST', f'{base}{endpoint}', json={'code': code, 'language': language})
+
+    timed(recorder, session, '/format_code', 'POST', f'{base}/format_code', json={'code': code, 'language': language})
+    timed(recorder, session, '/run_code', 'POST', f'{base}/run_code', json={'code': code, 'language': language})
+
+    if project_id:
+        timed(recorder, session, '/add_file', 'POST', f'{base}/add_file',
+              json={'project_id': project_id, 'content': code, 'language': language})
+        timed(recorder, session, '/get_history/<id>', 'GET', f'{base}/get_history/{project_id}')
+        timed(recorder, session, '/export_project/<id>', 'GET', f'{base}/export_project/{project_id}')
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100.0 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+def summarise(samples, wall_time):
+    results = {}
+    for endpoint, rows in sorted(samples.items()):
+        latencies = sorted(latency for latency, _, _ in rows)
+        results[endpoint] = {
+            'count': len(rows),
+            'http_errors': sum(1 for _, ok, _ in rows if not ok),
+            'app_errors': sum(1 for _, ok, app_ok in rows if ok and not app_ok),
+            'rps': round(len(rows) / wall_time, 3),
+            'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+            'p95_ms': round(percentile(latencies, 95) * 1000, 1),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 1),
+            'max_ms': round(latencies[-1] * 1000, 1),
+        }
+    return results
+
+
+def print_table(results, baseline=None):
+    header = f"{'endpoint':<24}{'count':>7}{'err':>6}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+    if baseline:
+        header += f"{'Δp50':>9}{'Δp95':>9}"
+    print(header)
+    print('-' * len(header))
+    for endpoint, row in results.items():
+        errors = row['http_errors'] + row['app_errors']
+        line = (f"{endpoint:<24}{row['count']:>7}{errors:>6}{row['rps']:>9.2f}"
+                f"{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}{row['p99_ms']:>10.1f}")
+        if baseline and endpoint in baseline:
+            line += f"{delta(baseline[endpoint]['p50_ms'], row['p50_ms']):>9}"
+            line += f"{delta(baseline[endpoint]['p95_ms'], row['p95_ms']):>9}"
+        print(line)
+
+
+def delta(before, after):
+    if not before:
+        return 'n/a'
+    return f"{(after - before) / before * 100:+.0f}%"
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def main():
+    args = parse_args()
+    configure_fakes(args)
+    import requests
+
+    server, base = start_server()
+    recorder = Recorder()
+    audio = silent_wav()
+    deadline = time.perf_counter() + args.duration
+    workflows = []
+
+    def user(index):
+        rng = random.Random(args.seed * 1000 + index)
+        completed = 0
+        while time.perf_counter() < deadline:
+            run_workflow(base, recorder, rng, audio)
+            completed += 1
+        workflows.append(completed)
+
+    print(f"Running {args.concurrency} virtual users for {args.duration:.0f}s against {base} ...")
+    start = time.perf_counter()
+    users = [threading.Thread(target=user, args=(i,)) for i in range(args.concurrency)]
+    for thread in users:
+        thread.start()
+    for thread in users:
+        thread.join()
+    wall_time = time.perf_counter() - start
+
+    server_metrics = requests.get(f'{base}/metrics', timeout=10).json()
+    server.shutdown()
+
+    results = summarise(recorder.samples, wall_time)
+    total = sum(row['count'] for row in results.values())
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': datetime.datetime.now().isoformat(),
+            'python': sys.version.split()[0],
+            'config': vars(args),
+        },
+        'overall': {
+            'requests': total,
+            'workflows': sum(workflows),
+            'wall_time_s': round(wall_time, 2),
+            'rps': round(total / wall_time, 2),
+            'errors': sum(row['http_errors'] + row['app_errors'] for row in results.values()),
+        },
+        'endpoints': results,
+        'server_metrics': server_metrics,
+    }
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"Comparing against {args.compare} (commit {baseline['meta'].get('commit')})")
+
+    print_table(results, baseline['endpoints'] if baseline else None)
+    overall = report['overall']
+    print(f"\n{overall['requests']} requests, {overall['workflows']} workflows, "
+          f"{overall['rps']} req/s, {overall['errors']} errors in {overall['wall_time_s']}s")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
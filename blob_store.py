@@ -0,0 +1,75 @@
+import hashlib
+import threading
+
+
+def content_hash(content):
+    """SHA-256 hex digest of a text buffer, the key for anything derived from it"""
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+class _Blob:
+    __slots__ = ('content', 'size', 'refs')
+
+    def __init__(self, content, size):
+        self.content = content
+        self.size = size
+        self.refs = 1
+
+
+class BlobStore:
+    """Content-addressed, reference-counted store for file contents.
+
+    Contents are keyed by SHA-256, so identical files across projects and
+    history versions are stored once and compared by hash. A blob is dropped
+    when its last reference is released.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._blobs = {}
+        self._bytes = 0
+        self._stats = {'dedup_hits': 0, 'bytes_deduplicated': 0}
+
+    def put(self, content, digest=None):
+        """Store content (if new) and take a reference; returns its digest"""
+        digest = digest or content_hash(content)
+        with self._lock:
+            blob = self._blobs.get(digest)
+            if blob is None:
+                blob = self._blobs[digest] = _Blob(content, len(content.encode('utf-8')))
+                self._bytes += blob.size
+            else:
+                blob.refs += 1
+                self._stats['dedup_hits'] += 1
+                self._stats['bytes_deduplicated'] += blob.size
+        return digest
+
+    def release(self, digest):
+        """Drop a reference, deleting the blob when none are left"""
+        with self._lock:
+            blob = self._blobs[digest]
+            blob.refs -= 1
+            if blob.refs <= 0:
+                del self._blobs[digest]
+                self._bytes -= blob.size
+
+    @property
+    def total_bytes(self):
+        """Bytes of content currently stored"""
+        return self._bytes
+
+    def get(self, digest):
+        """Content for a digest; raises KeyError if no reference holds it"""
+        return self._blobs[digest].content
+
+    def size(self, digest):
+        """Size in bytes of a stored blob"""
+        return self._blobs[digest].size
+
+    def stats(self):
+        with self._lock:
+            return dict(
+                self._stats,
+                blobs=len(self._blobs),
+                bytes=self._bytes,
+            )
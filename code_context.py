@@ -0,0 +1,218 @@
+import threading
+import time
+from collections import OrderedDict
+
+from blob_store import content_hash
+
+
+def estimate_tokens(text):
+    """Rough token count (about four characters per token)"""
+    return len(text) // 4 + 1
+
+
+def fit_to_budget(code, max_tokens):
+    """Truncate oversized code to the token budget, keeping its head and tail"""
+    if estimate_tokens(code) <= max_tokens:
+        return code, False
+
+    lines = code.split('\n')
+    half = max_tokens * 4 // 2
+    if any(len(line) > half for line in lines):
+        # A single huge line (e.g. minified JS) would leave nothing, cut by characters instead
+        omitted = len(code) - 2 * half
+        marker = f'\n... [{omitted} characters omitted to fit the context budget] ...\n'
+        return code[:half] + marker + code[-half:], True
+
+    head, head_size = [], 0
+    for line in lines:
+        if head_size + len(line) + 1 > half:
+            break
+        head.append(line)
+        head_size += len(line) + 1
+    tail, tail_size = [], 0
+    for line in reversed(lines[len(head):]):
+        if tail_size + len(line) + 1 > half:
+            break
+        tail.append(line)
+        tail_size += len(line) + 1
+    tail.reverse()
+
+    omitted = len(lines) - len(head) - len(tail)
+    marker = f'... [{omitted} lines omitted to fit the context budget] ...'
+    return '\n'.join(head + [marker] + tail), True
+
+
+class CodeContext:
+    """One registered code buffer and how to reference it upstream"""
+
+    def __init__(self, context_id, code, language, prefix, truncated):
+        self.context_id = context_id
+        self.code = code
+        self.language = language
+        self.prefix = prefix
+        self.truncated = truncated
+        self.tokens = estimate_tokens(prefix)
+        self.cache_lock = threading.Lock()
+        self.cache_handle = None
+        self.cache_expires = 0.0
+        self.cache_retry_at = 0.0
+
+    def to_dict(self):
+        return {
+            'context_id': self.context_id,
+            'language': self.language,
+            'tokens': self.tokens,
+            'truncated': self.truncated,
+            'provider_cached': self.cache_handle is not None,
+        }
+
+
+def render_prefix(code, language):
+    """Prompt prefix that introduces a code buffer"""
+    return f'You are helping with the following {language} code:\n\n{code}\n\n'
+
+
+class CodeContextStore:
+    """Registers each code buffer once and sends only instructions for later operations.
+
+    When a provider cache backend is given and the code is large enough, the
+    code is uploaded once as cached content and later requests carry only the
+    instruction. Otherwise the rendered prompt prefix is kept locally and
+    joined with the instruction server-side, so clients can send a context_id
+    instead of the whole file. Oversized files are truncated to the token budget
+    for analyses; operations that rewrite the file can ask for the full code.
+    """
+
+    def __init__(self, scheduler, cache_backend=None, max_tokens=60000, min_cache_tokens=4096,
+                 cache_ttl=600, max_contexts=256, cache_retry=60.0):
+        self.scheduler = scheduler
+        self.cache_backend = cache_backend
+        self.max_tokens = max_tokens
+        self.min_cache_tokens = min_cache_tokens
+        self.cache_ttl = cache_ttl
+        self.cache_retry = cache_retry
+        self.max_contexts = max_contexts
+        self._lock = threading.Lock()
+        self._contexts = OrderedDict()
+        self._sessions = OrderedDict()
+        self._stats = {
+            'registered': 0,
+            'reused': 0,
+            'truncated': 0,
+            'provider_cached': 0,
+            'provider_cache_errors': 0,
+            'bytes_saved': 0,
+        }
+
+    def register(self, code, language, session_id=None):
+        """Register a code buffer (idempotent) and make it the session's current context"""
+        context_id = content_hash(f'{language}\n{code}')
+        evicted = []
+        with self._lock:
+            context = self._contexts.get(context_id)
+            if context is not None:
+                self._contexts.move_to_end(context_id)
+                self._stats['reused'] += 1
+            else:
+                budgeted, truncated = fit_to_budget(code, self.max_tokens)
+                context = CodeContext(context_id, code, language, render_prefix(budgeted, language), truncated)
+                self._contexts[context_id] = context
+                self._stats['registered'] += 1
+                if truncated:
+                    self._stats['truncated'] += 1
+                evicted = self._evict()
+            if session_id is not None:
+                self._sessions[session_id] = context_id
+                self._sessions.move_to_end(session_id)
+                while len(self._sessions) > self.max_contexts:
+                    self._sessions.popitem(last=False)
+        for handle in evicted:
+            self._delete(handle)
+        return context
+
+    def get(self, context_id):
+        with self._lock:
+            context = self._contexts.get(context_id)
+            if context is not None:
+                self._contexts.move_to_end(context_id)
+            return context
+
+    def current(self, session_id):
+        """The context a session registered most recently, if it is still held"""
+        with self._lock:
+            context_id = self._sessions.get(session_id)
+        return self.get(context_id) if context_id else None
+
+    def generate(self, context, instruction, priority, full_code=False):
+        """Run an instruction against a registered context and return the response text.
+
+        With full_code, a truncated context is sent in full instead, for
+        instructions that must see (and return) the whole file.
+        """
+        if full_code and context.truncated:
+            return self.scheduler.generate(render_prefix(context.code, context.language) + instruction,
+                                           priority=priority).text
+        model = self._cached_model(context)
+        if model is not None:
+            with self._lock:
+                self._stats['bytes_saved'] += len(context.prefix.encode('utf-8'))
+            return self.scheduler.generate(instruction, priority=priority, model=model).text
+        return self.scheduler.generate(context.prefix + instruction, priority=priority).text
+
+    def stats(self):
+        with self._lock:
+            return dict(
+                self._stats,
+                contexts=len(self._contexts),
+                sessions=len(self._sessions),
+                provider_cache=self.cache_backend is not None,
+            )
+
+    def _cached_model(self, context):
+        """Model bound to the provider cache for this context, creating the cache on first use"""
+        if self.cache_backend is None or context.tokens < self.min_cache_tokens:
+            return None
+        stale = None
+        # One creator per context; concurrent first uses wait for its handle
+        with context.cache_lock:
+            now = time.monotonic()
+            if context.cache_handle is None or context.cache_expires <= now:
+                if context.cache_retry_at > now:
+                    return None
+                try:
+                    handle = self.cache_backend.create(context.prefix)
+                except Exception as e:
+                    print(f"Context cache error: {e}")
+                    # Back off instead of retrying the upload on every operation
+                    context.cache_retry_at = now + self.cache_retry
+                    with self._lock:
+                        self._stats['provider_cache_errors'] += 1
+                    return None
+                with self._lock:
+                    stale = context.cache_handle
+                    context.cache_handle = handle
+                    # Refresh a little before the provider expires it
+                    context.cache_expires = time.monotonic() + self.cache_ttl * 0.9
+                    self._stats['provider_cached'] += 1
+                    if self._contexts.get(context.context_id) is not context:
+                        # Evicted while the upload was in flight
+                        stale, context.cache_handle = handle, None
+            handle = context.cache_handle
+        if stale is not None:
+            self._delete(stale)
+        return self.cache_backend.model_for(handle) if handle is not None else None
+
+    def _delete(self, handle):
+        try:
+            self.cache_backend.delete(handle)
+        except Exception as e:
+            print(f"Context cache error: {e}")
+
+    def _evict(self):
+        """Drop least recently used contexts; returns provider handles to delete"""
+        handles = []
+        while len(self._contexts) > self.max_contexts:
+            _, context = self._contexts.popitem(last=False)
+            if context.cache_handle is not None:
+                handles.append(context.cache_handle)
+        return handles
@@ -1,4 +1,6 @@
+import getpass
 import os
+import tempfile
 from dotenv import load_dotenv
 
 
@@ -7,6 +9,15 @@ load_dotenv()
 # Get API key from environment
 GEMINIAPI_KEY = os.getenv('API_KEY')
 
+def default_spill_dir():
+    """Per-user spill directory under the system temp dir"""
+    try:
+        user = getpass.getuser()
+    except Exception:
+        # No LOGNAME/USER and no passwd entry, common in containers
+        user = str(os.getuid()) if hasattr(os, 'getuid') else 'default'
+    return os.path.join(tempfile.gettempdir(), f'v2c_projects_{user}')
+
 class Config:
     # Google Gemini API Configuration
     GEMINI_API_KEY = GEMINIAPI_KEY  # Replace with your actual API key
@@ -16,6 +27,61 @@ class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-secret-key-change-in-production'
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
     
+    # Multi-file project generation (the worker pool is shared by all requests)
+    MULTI_FILE_MAX_WORKERS = int(os.environ.get('MULTI_FILE_MAX_WORKERS', 8))
+    MULTI_FILE_MAX_FILES = int(os.environ.get('MULTI_FILE_MAX_FILES', 12))
+    
+    # LLM scheduler (priority queue, AIMD concurrency, retries, circuit breaker)
+    LLM_MAX_CONCURRENCY = int(os.environ.get('LLM_MAX_CONCURRENCY', 8))
+    LLM_INITIAL_CONCURRENCY = int(os.environ.get('LLM_INITIAL_CONCURRENCY', 4))
+    LLM_LATENCY_TARGET = float(os.environ.get('LLM_LATENCY_TARGET', 15.0))  # seconds
+    LLM_MAX_RETRIES = int(os.environ.get('LLM_MAX_RETRIES', 3))
+    LLM_BREAKER_THRESHOLD = int(os.environ.get('LLM_BREAKER_THRESHOLD', 5))
+    LLM_BREAKER_COOLDOWN = float(os.environ.get('LLM_BREAKER_COOLDOWN', 30.0))  # seconds
+    LLM_MAX_QUEUED_NORMAL = int(os.environ.get('LLM_MAX_QUEUED_NORMAL', 32))
+    LLM_MAX_QUEUED_BACKGROUND = int(os.environ.get('LLM_MAX_QUEUED_BACKGROUND', 16))
+    
+    # Speculative prefetch of explain/bugs/description after code generation
+    PREFETCH_ENABLED = os.environ.get('PREFETCH_ENABLED', '').lower() in ('1', 'true', 'yes')
+    PREFETCH_MAX_WORKERS = int(os.environ.get('PREFETCH_MAX_WORKERS', 2))
+    PREFETCH_MAX_ENTRIES = int(os.environ.get('PREFETCH_MAX_ENTRIES', 256))
+    
+    # /batch endpoint: shared worker pool, per-operation timeout and request size limit
+    BATCH_MAX_WORKERS = int(os.environ.get('BATCH_MAX_WORKERS', 8))
+    BATCH_OP_TIMEOUT = float(os.environ.get('BATCH_OP_TIMEOUT', 60))  # seconds
+    BATCH_MAX_OPERATIONS = int(os.environ.get('BATCH_MAX_OPERATIONS', 16))
+    
+    # Session code contexts (register a file once instead of resending it in every prompt)
+    CODE_CONTEXT_MAX_TOKENS = int(os.environ.get('CODE_CONTEXT_MAX_TOKENS', 60000))
+    CODE_CONTEXT_MIN_CACHE_TOKENS = int(os.environ.get('CODE_CONTEXT_MIN_CACHE_TOKENS', 4096))
+    CODE_CONTEXT_CACHE_TTL = int(os.environ.get('CODE_CONTEXT_CACHE_TTL', 600))  # seconds
+    CODE_CONTEXT_MAX_ENTRIES = int(os.environ.get('CODE_CONTEXT_MAX_ENTRIES', 256))
+    
+    # Project memory tier (idle or over-budget projects are spilled to disk)
+    PROJECT_MEMORY_BUDGET = int(os.environ.get('PROJECT_MEMORY_BUDGET', 256 * 1024 * 1024))  # bytes
+    PROJECT_IDLE_SECONDS = int(os.environ.get('PROJECT_IDLE_SECONDS', 30 * 60))
+    PROJECT_SPILL_INTERVAL = int(os.environ.get('PROJECT_SPILL_INTERVAL', 60))  # seconds
+    # Per-user default so another account cannot own the directory (it is created with mode 0700)
+    PROJECT_SPILL_DIR = os.environ.get('PROJECT_SPILL_DIR') or default_spill_dir()
+    
+    # Admin-only endpoints such as the sampling profiler (disabled when unset)
+    ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', '')
+    PROFILER_INTERVAL = float(os.environ.get('PROFILER_INTERVAL', 0.005))  # seconds between samples
+    
+    # Local fakes for Gemini, googletrans and speech recognition (testing and benchmarks)
+    FAKE_GEMINI = os.environ.get('FAKE_GEMINI', '').lower() in ('1', 'true', 'yes')
+    FAKE_GEMINI_LATENCY = float(os.environ.get('FAKE_GEMINI_LATENCY', 0.5))  # seconds
+    FAKE_GEMINI_JITTER = float(os.environ.get('FAKE_GEMINI_JITTER', 0.0))  # seconds
+    FAKE_GEMINI_TOKENS_PER_SECOND = float(os.environ.get('FAKE_GEMINI_TOKENS_PER_SECOND', 0)) or None
+    FAKE_GEMINI_429_RATE = float(os.environ.get('FAKE_GEMINI_429_RATE', 0.0))
+    FAKE_GEMINI_ERROR_RATE = float(os.environ.get('FAKE_GEMINI_ERROR_RATE', 0.0))
+    FAKE_TRANSLATOR = os.environ.get('FAKE_TRANSLATOR', '').lower() in ('1', 'true', 'yes')
+    FAKE_TRANSLATOR_LATENCY = float(os.environ.get('FAKE_TRANSLATOR_LATENCY', 0.1))  # seconds
+    FAKE_TRANSLATOR_ERROR_RATE = float(os.environ.get('FAKE_TRANSLATOR_ERROR_RATE', 0.0))
+    FAKE_SPEECH = os.environ.get('FAKE_SPEECH', '').lower() in ('1', 'true', 'yes')
+    FAKE_SPEECH_LATENCY = float(os.environ.get('FAKE_SPEECH_LATENCY', 0.3))  # seconds
+    FAKE_SPEECH_ERROR_RATE = float(os.environ.get('FAKE_SPEECH_ERROR_RATE', 0.0))
+    
     # Supported Languages
     SUPPORTED_LANGUAGES = {
         'en': 'English',
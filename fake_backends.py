@@ -0,0 +1,166 @@
+import random
+import threading
+import time
+
+
+class FakeRateLimitError(Exception):
+    """Stand-in for the upstream 429 / ResourceExhausted error"""
+    code = 429
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+def default_responder(prompt):
+    """Return a plausible canned answer for the prompts app.py sends"""
+    if '"is_multi_file"' in prompt:
+        return ('{"is_multi_file": true, "files": ['
+                '{"filename": "main.py", "purpose": "Entry point", "interface": "def main() -> None"}, '
+                '{"filename": "utils.py", "purpose": "Helpers", "interface": "def helper(value: int) -> int"}]}')
+    return '```python\n# Generated by the fake model\ndef main():\n    print("hello")\n\nmain()\n```'
+
+
+class FakeGenerativeModel:
+    """Local stand-in for genai.GenerativeModel with latency, token rate and 429 injection"""
+
+    def __init__(self, latency=0.0, jitter=0.0, rate_limit_rate=0.0, error_rate=0.0,
+                 max_concurrency=None, responder=None, seed=None, tokens_per_second=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.tokens_per_second = tokens_per_second
+        self.rate_limit_rate = rate_limit_rate
+        self.error_rate = error_rate
+        self.max_concurrency = max_concurrency
+        self.responder = responder or default_responder
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.active = 0
+        self.calls = 0
+        self.rate_limited = 0
+        self.bytes_sent = 0
+
+    def generate_content(self, prompt, cached_prefix='', **kwargs):
+        with self._lock:
+            self.calls += 1
+            self.bytes_sent += len(prompt.encode('utf-8'))
+            over_quota = self.max_concurrency is not None and self.active >= self.max_concurrency
+            throttle = over_quota or self._random.random() < self.rate_limit_rate
+            fail = self._random.random() < self.error_rate
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            if throttle:
+                self.rate_limited += 1
+            else:
+                self.active += 1
+
+        if throttle:
+            raise FakeRateLimitError('429 Resource has been exhausted (e.g. check quota).')
+        try:
+            text = self.responder(cached_prefix + prompt)
+            if self.tokens_per_second:
+                # Simulate generation time proportional to output length (~4 chars per token)
+                delay += len(text) / 4 / self.tokens_per_second
+            time.sleep(delay)
+            if fail:
+                raise ConnectionError('Fake upstream connection reset')
+            return FakeResponse(text)
+        finally:
+            with self._lock:
+                self.active -= 1
+
+
+class FakeContextCache:
+    """Stand-in for provider-side cached content backed by a FakeGenerativeModel"""
+
+    def __init__(self, model):
+        self.model = model
+        self._lock = threading.Lock()
+        self._handles = {}
+        self._counter = 0
+
+    def create(self, prefix):
+        with self._lock:
+            self._counter += 1
+            handle = f'cachedContents/fake-{self._counter}'
+            self._handles[handle] = prefix
+        with self.model._lock:
+            self.model.bytes_sent += len(prefix.encode('utf-8'))
+        return handle
+
+    def model_for(self, handle):
+        with self._lock:
+            prefix = self._handles[handle]
+        return _FakeCachedModel(self.model, prefix)
+
+    def delete(self, handle):
+        with self._lock:
+            self._handles.pop(handle, None)
+
+
+class _FakeCachedModel:
+    def __init__(self, model, prefix):
+        self.model = model
+        self.prefix = prefix
+
+    def generate_content(self, prompt, **kwargs):
+        return self.model.generate_content(prompt, cached_prefix=self.prefix, **kwargs)
+
+
+class _Detected:
+    def __init__(self, lang):
+        self.lang = lang
+
+
+class _Translated:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeTranslator:
+    """Local stand-in for googletrans.Translator; non-ASCII text is treated as Spanish"""
+
+    def __init__(self, latency=0.0, error_rate=0.0, seed=None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _call(self):
+        with self._lock:
+            fail = self._random.random() < self.error_rate
+        time.sleep(self.latency)
+        if fail:
+            raise ConnectionError('Fake translation service unavailable')
+
+    def detect(self, text):
+        self._call()
+        return _Detected('en' if text.isascii() else 'es')
+
+    def translate(self, text, dest='en'):
+        self._call()
+        return _Translated(text.encode('ascii', 'ignore').decode('ascii'))
+
+
+class FakeRecognizer:
+    """Local stand-in for speech_recognition.Recognizer returning a fixed transcript"""
+
+    def __init__(self, latency=0.0, error_rate=0.0, transcript='create a function that adds two numbers',
+                 seed=None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.transcript = transcript
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def record(self, source):
+        return source
+
+    def recognize_google(self, audio):
+        with self._lock:
+            fail = self._random.random() < self.error_rate
+        time.sleep(self.latency)
+        if fail:
+            import speech_recognition as sr
+            raise sr.RequestError('Fake speech service unavailable')
+        return self.transcript
@@ -0,0 +1,305 @@
+import contextlib
+import heapq
+import itertools
+import random
+import threading
+import time
+
+# Priority classes, lower value is served first
+INTERACTIVE = 0
+NORMAL = 1
+BACKGROUND = 2
+
+PRIORITY_NAMES = {INTERACTIVE: 'interactive', NORMAL: 'normal', BACKGROUND: 'background'}
+
+_local = threading.local()
+
+
+class LLMOverloadedError(Exception):
+    """Raised when a request is shed instead of being sent upstream"""
+
+
+class CircuitOpenError(LLMOverloadedError):
+    """Raised while the circuit breaker is open after repeated upstream failures"""
+
+
+def is_rate_limited(error):
+    """Check whether an upstream error is a 429 / quota exhaustion"""
+    if getattr(error, 'code', None) == 429:
+        return True
+    if type(error).__name__ in ('ResourceExhausted', 'TooManyRequests'):
+        return True
+    # Quota errors re-raised without a code keep the upstream wording
+    return 'Resource has been exhausted' in str(error)
+
+
+@contextlib.contextmanager
+def before_upstream(callback):
+    """Call callback in this thread right before each upstream send.
+
+    The callback runs once a concurrency slot is held; raising from it aborts
+    the request without sending it.
+    """
+    previous = getattr(_local, 'before_upstream', None)
+    _local.before_upstream = callback
+    try:
+        yield
+    finally:
+        _local.before_upstream = previous
+
+
+def is_transient(error):
+    """Check whether an upstream error is worth retrying"""
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    return getattr(error, 'code', None) in (500, 502, 503, 504)
+
+
+class LLMScheduler:
+    """Central gate in front of generate_content.
+
+    Requests wait in a priority queue for a concurrency slot. The number of
+    slots follows AIMD: it grows by roughly one per round of fast successes and
+    is cut multiplicatively (at most once per round trip) on upstream 429s or
+    slow responses. Throttled and transient failures are retried with jittered
+    exponential backoff. Throttling only shrinks the window, so low-priority
+    work is shed when its queue fills; repeated hard failures open a circuit
+    breaker.
+    """
+
+    def __init__(self, model, min_concurrency=1, max_concurrency=8, initial_concurrency=4,
+                 latency_target=15.0, decrease_factor=0.5, decrease_cooldown=1.0,
+                 max_retries=3, backoff_base=0.5, backoff_max=8.0,
+                 breaker_threshold=5, breaker_cooldown=30.0,
+                 max_queued=None, queue_timeout=60.0, profiler=None,
+                 clock=time.monotonic, sleep=time.sleep):
+        self.model = model
+        self.profiler = profiler
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.latency_target = latency_target
+        self.decrease_factor = decrease_factor
+        self.decrease_cooldown = decrease_cooldown
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self.max_queued = max_queued if max_queued is not None else {NORMAL: 32, BACKGROUND: 16}
+        self.queue_timeout = queue_timeout
+        self._clock = clock
+        self._sleep = sleep
+
+        self._cond = threading.Condition()
+        self._limit = float(min(max(initial_concurrency, min_concurrency), max_concurrency))
+        self._in_flight = 0
+        self._waiting = []
+        self._seq = itertools.count()
+        self._last_decrease = float('-inf')
+
+        self._consecutive_failures = 0
+        self._breaker_open_until = None
+        self._probe_in_flight = False
+
+        self._counters = {
+            'requests': 0,
+            'succeeded': 0,
+            'failed': 0,
+            'throttled': 0,
+            'retries': 0,
+            'shed': 0,
+            'breaker_rejected': 0,
+            'breaker_opened': 0,
+            'bytes_sent': 0,
+        }
+        self._latency_ewma = None
+
+    def generate(self, prompt, priority=NORMAL, model=None, **kwargs):
+        """Send a prompt upstream through the scheduler and return the response"""
+        target = model or self.model
+        with self._cond:
+            self._counters['requests'] += 1
+
+        attempt = 0
+        last_error = None
+        while True:
+            probe = False
+            try:
+                probe = self._admit(priority)
+                with self._span('llm.queue'):
+                    self._acquire(priority)
+            except LLMOverloadedError as e:
+                with self._cond:
+                    if probe:
+                        self._probe_in_flight = False
+                    if last_error is not None:
+                        # A retry was shed or rejected: the request failed
+                        self._counters['failed'] += 1
+                if last_error is not None:
+                    raise e from last_error
+                raise
+            hook = getattr(_local, 'before_upstream', None)
+            if hook is not None:
+                try:
+                    hook()
+                except BaseException:
+                    self._release()
+                    if probe:
+                        with self._cond:
+                            self._probe_in_flight = False
+                    raise
+            start = self._clock()
+            with self._cond:
+                self._counters['bytes_sent'] += len(prompt.encode('utf-8'))
+            try:
+                with self._span('llm.upstream'):
+                    response = target.generate_content(prompt, **kwargs)
+            except Exception as e:
+                self._release()
+                retryable = self._on_error(e, probe)
+                if not retryable or attempt >= self.max_retries:
+                    with self._cond:
+                        self._counters['failed'] += 1
+                    raise
+                with self._cond:
+                    self._counters['retries'] += 1
+                last_error = e
+                self._sleep(self._backoff(attempt))
+                attempt += 1
+                continue
+
+            self._release()
+            self._on_success(self._clock() - start, probe)
+            return response
+
+    def _span(self, name):
+        if self.profiler is None:
+            return contextlib.nullcontext()
+        return self.profiler.span(name)
+
+    def stats(self):
+        """Snapshot of the scheduler state for metrics"""
+        with self._cond:
+            queued = {name: 0 for name in PRIORITY_NAMES.values()}
+            for priority, _ in self._waiting:
+                queued[PRIORITY_NAMES.get(priority, str(priority))] += 1
+            return dict(
+                self._counters,
+                concurrency_limit=round(self._limit, 2),
+                in_flight=self._in_flight,
+                queued=queued,
+                breaker_state=self._breaker_state(),
+                latency_ewma=round(self._latency_ewma, 3) if self._latency_ewma is not None else None,
+            )
+
+    def _breaker_state(self):
+        if self._breaker_open_until is None:
+            return 'closed'
+        if self._clock() < self._breaker_open_until:
+            return 'open'
+        return 'half_open'
+
+    def _admit(self, priority):
+        """Apply the circuit breaker and load shedding; returns True for a half-open probe"""
+        with self._cond:
+            state = self._breaker_state()
+            if state == 'open' or (state == 'half_open' and self._probe_in_flight):
+                self._counters['breaker_rejected'] += 1
+                raise CircuitOpenError('LLM service is temporarily unavailable, please retry shortly')
+
+            limit = self.max_queued.get(priority)
+            if limit is not None:
+                ahead = sum(1 for p, _ in self._waiting if p <= priority)
+                if ahead >= limit:
+                    self._counters['shed'] += 1
+                    raise LLMOverloadedError('LLM service is busy, please retry shortly')
+
+            if state == 'half_open':
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def _acquire(self, priority):
+        with self._cond:
+            ticket = (priority, next(self._seq))
+            heapq.heappush(self._waiting, ticket)
+            deadline = self._clock() + self.queue_timeout
+            while self._waiting[0] != ticket or self._in_flight >= max(1, int(self._limit)):
+                remaining = deadline - self._clock()
+                if remaining <= 0:
+                    self._waiting.remove(ticket)
+                    heapq.heapify(self._waiting)
+                    self._counters['shed'] += 1
+                    self._cond.notify_all()
+                    raise LLMOverloadedError('LLM service is busy, please retry shortly')
+                self._cond.wait(remaining)
+            heapq.heappop(self._waiting)
+            self._in_flight += 1
+            # The next waiter may also fit under the limit
+            self._cond.notify_all()
+
+    def _release(self):
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    def _decrease(self):
+        # Cut once per round trip: responses to requests sent before the last
+        # cut say nothing about the new window
+        now = self._clock()
+        cooldown = self.decrease_cooldown
+        if self._latency_ewma is not None:
+            cooldown = min(cooldown, self._latency_ewma)
+        if now - self._last_decrease >= cooldown:
+            self._limit = max(self.min_concurrency, self._limit * self.decrease_factor)
+            self._last_decrease = now
+
+    def _on_success(self, latency, probe):
+        with self._cond:
+            self._counters['succeeded'] += 1
+            self._consecutive_failures = 0
+            if probe or self._breaker_open_until is not None:
+                self._breaker_open_until = None
+                self._probe_in_flight = False
+
+            if self._latency_ewma is None:
+                self._latency_ewma = latency
+            else:
+                self._latency_ewma = 0.8 * self._latency_ewma + 0.2 * latency
+
+            if latency > self.latency_target:
+                self._decrease()
+            else:
+                self._limit = min(self.max_concurrency, self._limit + 1.0 / self._limit)
+            self._cond.notify_all()
+
+    def _on_error(self, error, probe):
+        """Record an upstream error; returns whether it should be retried"""
+        throttled = is_rate_limited(error)
+        retryable = throttled or is_transient(error)
+        with self._cond:
+            if probe:
+                self._probe_in_flight = False
+            if not retryable:
+                return False
+            if throttled:
+                # Throttling means we are sending too fast, AIMD handles it.
+                # It never counts toward the breaker: upstream is reachable.
+                self._counters['throttled'] += 1
+                self._decrease()
+                return True
+            return not self._record_failure(probe)
+
+    def _record_failure(self, probe=False):
+        """Count a hard failure; returns True if it opened the breaker"""
+        self._consecutive_failures += 1
+        if probe or self._consecutive_failures >= self.breaker_threshold:
+            self._breaker_open_until = self._clock() + self.breaker_cooldown
+            self._counters['breaker_opened'] += 1
+            self._consecutive_failures = 0
+            return True
+        return False
+
+    def _backoff(self, attempt):
+        """Full-jitter exponential backoff"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
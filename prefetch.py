@@ -0,0 +1,153 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+
+from blob_store import content_hash
+from llm_scheduler import before_upstream
+
+
+class _Prefetch:
+    """One background job and the owners that asked for it"""
+
+    def __init__(self):
+        self.future = None
+        self.owners = set()
+        # Set once the job holds a scheduler slot and is about to call upstream
+        self.started = False
+        # Set when nobody needs the result; the job then never calls upstream
+        self.abandoned = False
+
+
+class Prefetcher:
+    """Speculatively runs follow-up analyses (explain, bugs, description) in the background.
+
+    Results are keyed by (operation, code hash, language). Each owner (a user
+    session) has one current code hash; when its code changes, the prefetches
+    for the old code are cancelled or their results dropped, unless another
+    owner still wants them. A caller only waits on a job whose upstream call
+    has started; one still queued (in the pool or in the scheduler's background
+    queue) is abandoned and recomputed at the caller's priority.
+    """
+
+    def __init__(self, max_workers=2, max_entries=256):
+        self.max_entries = max_entries
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='prefetch')
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._owners = OrderedDict()
+        self._stats = {
+            'scheduled': 0,
+            'hits': 0,
+            'attached': 0,
+            'misses': 0,
+            'cancelled': 0,
+        }
+
+    def schedule(self, owner, code, language, jobs):
+        """Queue background jobs ({operation: fn(code, language)}) for freshly generated code"""
+        digest = content_hash(code)
+        with self._lock:
+            self._retarget(owner, digest)
+            for operation, fn in jobs.items():
+                key = (operation, digest, language)
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                else:
+                    entry = _Prefetch()
+                    entry.future = self._executor.submit(self._run, entry, fn, code, language)
+                    self._entries[key] = entry
+                    self._stats['scheduled'] += 1
+                entry.owners.add(owner)
+                self._owners[owner][1].add(key)
+            while len(self._entries) > self.max_entries:
+                _, entry = self._entries.popitem(last=False)
+                self._abandon(entry)
+
+    def get(self, operation, code, language, compute, owner=None):
+        """Return the prefetched result if there is one, otherwise run compute()"""
+        digest = content_hash(code)
+        key = (operation, digest, language)
+        with self._lock:
+            if owner is not None:
+                self._retarget(owner, digest)
+            entry = self._entries.get(key)
+            if entry is not None and not entry.started and not entry.future.done():
+                # Still queued behind background work, faster to run it ourselves
+                del self._entries[key]
+                self._abandon(entry)
+                entry = None
+
+        if entry is not None:
+            was_done = entry.future.done()
+            try:
+                result = entry.future.result()
+            except Exception:
+                result = None
+            else:
+                with self._lock:
+                    self._stats['hits' if was_done else 'attached'] += 1
+                return result
+
+        with self._lock:
+            self._stats['misses'] += 1
+        return compute()
+
+    def cancel(self, owner):
+        """Drop every prefetch belonging to an owner"""
+        with self._lock:
+            self._release(owner, self._owners.pop(owner, (None, set()))[1])
+
+    def stats(self):
+        with self._lock:
+            served = self._stats['hits'] + self._stats['attached']
+            lookups = served + self._stats['misses']
+            return dict(
+                self._stats,
+                entries=len(self._entries),
+                hit_rate=round(served / lookups, 3) if lookups else None,
+            )
+
+    def _run(self, entry, fn, code, language):
+        with before_upstream(lambda: self._claim(entry)):
+            return fn(code, language)
+
+    def _claim(self, entry):
+        """Called by the scheduler before the upstream call; aborts abandoned jobs"""
+        with self._lock:
+            if entry.abandoned:
+                raise CancelledError('Prefetch is no longer needed')
+            entry.started = True
+
+    def _retarget(self, owner, digest):
+        """Point an owner at new code, releasing its prefetches for the previous code"""
+        current = self._owners.get(owner)
+        if current is not None and current[0] == digest:
+            self._owners.move_to_end(owner)
+            return
+        if current is not None:
+            self._release(owner, current[1])
+        self._owners[owner] = (digest, set())
+        self._owners.move_to_end(owner)
+        while len(self._owners) > self.max_entries:
+            stale, (_, keys) = self._owners.popitem(last=False)
+            self._release(stale, keys)
+
+    def _release(self, owner, keys):
+        """Drop an owner's interest in keys, cancelling jobs no other owner wants"""
+        for key in keys:
+            entry = self._entries.get(key)
+            if entry is None:
+                continue
+            entry.owners.discard(owner)
+            if not entry.owners:
+                del self._entries[key]
+                self._abandon(entry)
+
+    def _abandon(self, entry):
+        """Stop a job before it reaches upstream if possible; counts it if so"""
+        if entry.future.done() or entry.abandoned:
+            return
+        entry.abandoned = True
+        if entry.future.cancel() or not entry.started:
+            self._stats['cancelled'] += 1
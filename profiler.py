@@ -0,0 +1,198 @@
+import contextlib
+import math
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+_NULL_SPAN = contextlib.nullcontext()
+
+
+def _positive(value, kind, name):
+    """Coerce an optional setting to a finite number > 0, raising ValueError otherwise"""
+    if value is None:
+        return None
+    try:
+        if isinstance(value, bool):
+            raise TypeError
+        number = kind(value)
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError(f'{name} must be a positive number') from None
+    if not (math.isfinite(number) and number > 0):
+        raise ValueError(f'{name} must be a positive number')
+    return number
+
+
+class SamplingProfiler:
+    """On-demand statistical profiler for request threads.
+
+    While a session is active, a background thread periodically captures the
+    Python stacks of threads that are handling a profiled request and counts
+    them in collapsed-stack form (suitable for flamegraph.pl / speedscope).
+    Named spans mark interesting call sites such as LLM and translation calls.
+    When no session is active every hook is a single attribute check.
+    """
+
+    def __init__(self, interval=0.005, max_depth=64, max_stacks=20000):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.max_stacks = max_stacks
+        self.active = False
+        self._lock = threading.Lock()
+        self._threads = {}
+        self._reset()
+
+    def start(self, duration=None, route=None, requests=None, interval=None):
+        """Start a session for a time window and/or the next N requests to a route"""
+        duration = _positive(duration, float, 'duration')
+        requests = _positive(requests, int, 'requests')
+        interval = _positive(interval, float, 'interval')
+        if route is not None and not isinstance(route, str):
+            raise ValueError('route must be an endpoint name or URL rule')
+        with self._lock:
+            if self.active:
+                raise RuntimeError('A profiling session is already running')
+            self._reset()
+            self.interval = interval or self.interval
+            self._route = route
+            self._remaining = requests
+            self._deadline = time.monotonic() + duration if duration else None
+            self._started = time.time()
+            self.active = True
+        threading.Thread(target=self._sample_loop, name='profiler', daemon=True).start()
+
+    def stop(self):
+        with self._lock:
+            self._stop()
+
+    def begin_request(self, endpoint, rule=None):
+        """Track the current thread if this request should be profiled"""
+        with self._lock:
+            if not self.active:
+                return
+            if self._route and self._route not in (endpoint, rule):
+                return
+            if self._remaining is not None:
+                if self._remaining <= 0:
+                    return
+                self._remaining -= 1
+            self._threads[threading.get_ident()] = [endpoint or rule or '?', [], time.perf_counter()]
+
+    def end_request(self):
+        ident = threading.get_ident()
+        with self._lock:
+            state = self._threads.pop(ident, None)
+            if state is None:
+                return
+            elapsed = time.perf_counter() - state[2]
+            route = self._routes.setdefault(state[0], [0, 0.0])
+            route[0] += 1
+            route[1] += elapsed
+            if self._remaining == 0 and not self._threads:
+                self._stop()
+
+    def span(self, name):
+        """Context manager naming a section of a profiled request (no-op when inactive)"""
+        if not self.active or threading.get_ident() not in self._threads:
+            return _NULL_SPAN
+        return self._span(name)
+
+    @contextlib.contextmanager
+    def _span(self, name):
+        # The sampler reads the span stack under the lock, so push and pop under it too
+        with self._lock:
+            state = self._threads.get(threading.get_ident())
+            if state is not None:
+                state[1].append(name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                span = self._spans.setdefault(name, [0, 0.0])
+                span[0] += 1
+                span[1] += elapsed
+                if state is not None and state[1]:
+                    state[1].pop()
+
+    def collapsed(self):
+        """Collapsed stacks, one 'frame;frame;frame count' line per distinct stack"""
+        with self._lock:
+            return '\n'.join(f'{stack} {count}' for stack, count in self._stacks.most_common())
+
+    def report(self, top=50):
+        """Summary with per-function cumulative/self time, span and route timings"""
+        with self._lock:
+            def timing(counter):
+                return [{'function': name, 'samples': count, 'seconds': round(count * self.interval, 4)}
+                        for name, count in counter.most_common(top)]
+
+            return {
+                'active': self.active,
+                'started_at': self._started,
+                'interval': self.interval,
+                'samples': self._samples,
+                'cumulative': timing(self._cumulative),
+                'self': timing(self._self),
+                'spans': {name: {'calls': calls, 'seconds': round(total, 4),
+                                 'samples': self._span_samples.get(name, 0)}
+                          for name, (calls, total) in self._spans.items()},
+                'routes': {name: {'requests': count, 'seconds': round(total, 4)}
+                           for name, (count, total) in self._routes.items()},
+            }
+
+    def _reset(self):
+        self._stacks = Counter()
+        self._cumulative = Counter()
+        self._self = Counter()
+        self._span_samples = Counter()
+        self._spans = {}
+        self._routes = {}
+        self._samples = 0
+        self._started = None
+        self._route = None
+        self._remaining = None
+        self._deadline = None
+
+    def _stop(self):
+        self.active = False
+        self._threads.clear()
+
+    def _sample_loop(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self.active:
+                    return
+                if self._deadline is not None and time.monotonic() >= self._deadline:
+                    self._stop()
+                    return
+                if self._threads:
+                    frames = sys._current_frames()
+                    for ident, (route, spans, _) in self._threads.items():
+                        frame = frames.get(ident)
+                        if frame is not None:
+                            self._record(route, spans, frame)
+
+    def _record(self, route, spans, frame):
+        names = []
+        while frame is not None and len(names) < self.max_depth:
+            code = frame.f_code
+            names.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+            frame = frame.f_back
+        names.reverse()
+
+        stack = ';'.join([route] + names)
+        if stack in self._stacks or len(self._stacks) < self.max_stacks:
+            self._stacks[stack] += 1
+        else:
+            self._stacks[f'{route};[truncated]'] += 1
+        self._samples += 1
+        for name in set(names):
+            self._cumulative[name] += 1
+        if names:
+            self._self[names[-1]] += 1
+        if spans:
+            self._span_samples[spans[-1]] += 1
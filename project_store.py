@@ -0,0 +1,329 @@
+import datetime
+import json
+import os
+import threading
+import time
+import uuid
+import zlib
+
+from blob_store import BlobStore
+
+
+class ProjectNotFoundError(KeyError):
+    """Raised when a project id is unknown"""
+
+
+class _ProjectEntry:
+    """Per-project lock plus the currently published snapshot and history.
+
+    Writers hold the entry lock, build new objects and swap the references in.
+    Published snapshots and history tuples are never mutated afterwards, so
+    readers can use them without taking any lock. A spilled entry has both
+    set to None until it is loaded back from disk.
+
+    Files and history entries hold content hashes; blobs is the set of hashes
+    this project holds a blob store reference for (one per distinct content).
+    """
+
+    def __init__(self, snapshot):
+        self.lock = threading.Lock()
+        self.snapshot = snapshot
+        self.history = ()
+        self.blobs = set()
+        self.overhead = 0
+        self.size = 0
+        self.last_access = time.monotonic()
+
+
+# Rough per-object overhead on top of the stored content
+_PROJECT_OVERHEAD = 512
+_ITEM_OVERHEAD = 256
+
+
+def _measure(entry, blob_store):
+    """Approximate (bookkeeping overhead, distinct content bytes) of a resident project"""
+    overhead = _PROJECT_OVERHEAD + _ITEM_OVERHEAD * (len(entry.snapshot['files']) + len(entry.history))
+    return overhead, sum(blob_store.size(digest) for digest in entry.blobs)
+
+
+class ProjectRegistry:
+    """Concurrency-safe store for projects and their code history.
+
+    The registry lock only guards the id -> entry mapping and the overhead
+    accounting, and is held briefly; edits to different projects take
+    different locks and never contend. Locks are always taken entry first,
+    registry second.
+
+    Resident memory (bookkeeping overhead plus blob store bytes, so shared
+    contents count once) is kept under memory_budget bytes. When the budget is
+    exceeded, or a project has been idle for idle_seconds, the least recently
+    used projects are written to spill_dir as compressed JSON and transparently
+    loaded back on their next access. The directory is owner-only, and files
+    left by a previous process (whose ids are gone) are removed at startup.
+
+    File contents live in a shared BlobStore keyed by SHA-256, so identical
+    contents across files, versions and projects are stored once.
+    """
+
+    def __init__(self, memory_budget=None, idle_seconds=None, spill_dir=None, blob_store=None):
+        self.blob_store = blob_store or BlobStore()
+        self.memory_budget = memory_budget
+        self.idle_seconds = idle_seconds
+        self.spill_dir = spill_dir
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._overhead_bytes = 0
+        self._stats = {'spills': 0, 'loads': 0}
+        if spill_dir:
+            os.makedirs(spill_dir, mode=0o700, exist_ok=True)
+            # Spilled files hold full project source; fails if another user owns the directory
+            os.chmod(spill_dir, 0o700)
+            self._clear_spill_dir()
+
+    def create(self, name, language):
+        """Create an empty project; returns (project_id, snapshot)"""
+        now = datetime.datetime.now()
+        snapshot = {
+            'name': name,
+            'language': language,
+            'files': {},
+            'created_at': now.isoformat(),
+            'readme': ''
+        }
+        entry = _ProjectEntry(snapshot)
+        entry.overhead = entry.size = _measure(entry, self.blob_store)[0]
+        with self._lock:
+            project_id = self._new_id(now)
+            self._entries[project_id] = entry
+            self._overhead_bytes += entry.overhead
+        return project_id, snapshot
+
+    def __contains__(self, project_id):
+        return project_id in self._entries
+
+    def get(self, project_id, with_content=False):
+        """Current snapshot of a project, or None; files carry 'hash' and optionally 'content'"""
+        entry = self._entries.get(project_id)
+        if entry is None:
+            return None
+        if not with_content:
+            return self._read(project_id, entry)[0]
+        return self._resolved(project_id, entry, lambda snapshot, history: dict(snapshot, files={
+            filename: dict(file_data, content=self.blob_store.get(file_data['hash']))
+            for filename, file_data in snapshot['files'].items()
+        }))
+
+    def history(self, project_id, with_content=False, last=None):
+        """Immutable tuple of (the last N) history entries for a project"""
+        entry = self._entries.get(project_id)
+        if entry is None:
+            return ()
+        if not with_content:
+            history = self._read(project_id, entry)[1]
+            return history[-last:] if last else history
+        return self._resolved(project_id, entry, lambda snapshot, history: tuple(
+            dict(version, content=self.blob_store.get(version['hash']))
+            for version in (history[-last:] if last else history)
+        ))
+
+    def add_file(self, project_id, filename, content, language, default_filename=None):
+        """Store a file and record it in the history; returns (filename, snapshot)"""
+        entry = self._entry(project_id)
+        with entry.lock:
+            self._ensure_resident(project_id, entry)
+            files = dict(entry.snapshot['files'])
+            if not filename:
+                filename = default_filename(files) if default_filename else 'main.txt'
+            digest = self.blob_store.put(content)
+            overhead = _ITEM_OVERHEAD if filename in files else 2 * _ITEM_OVERHEAD
+            content_bytes = 0
+            if digest in entry.blobs:
+                # This project already holds a reference to identical content
+                self.blob_store.release(digest)
+            else:
+                entry.blobs.add(digest)
+                content_bytes = self.blob_store.size(digest)
+            now = datetime.datetime.now().isoformat()
+            files[filename] = {
+                'hash': digest,
+                'created_at': now,
+                'language': language
+            }
+            entry.snapshot = dict(entry.snapshot, files=files)
+            entry.history = entry.history + ({
+                'timestamp': now,
+                'action': 'add_file',
+                'filename': filename,
+                'hash': digest
+            },)
+            self._grow(entry, overhead, content_bytes)
+            snapshot = entry.snapshot
+        self.enforce_budget(keep=project_id)
+        return filename, snapshot
+
+    def rollback(self, project_id, version_index):
+        """Restore a file to a history version; returns the history entry with its content"""
+        entry = self._entry(project_id)
+        with entry.lock:
+            self._ensure_resident(project_id, entry)
+            if version_index >= len(entry.history) or version_index < 0:
+                raise IndexError('Invalid version')
+            version = entry.history[version_index]
+            filename = version['filename']
+            current = entry.snapshot['files'].get(filename)
+            if current is not None and current['hash'] != version['hash']:
+                # History holds a reference to every version, so no refcount change
+                files = dict(entry.snapshot['files'])
+                files[filename] = dict(current, hash=version['hash'])
+                entry.snapshot = dict(entry.snapshot, files=files)
+            return dict(version, content=self.blob_store.get(version['hash']))
+
+    def stats(self):
+        """Resident/spilled counts and memory accounting for metrics"""
+        with self._lock:
+            resident = [entry.size for entry in self._entries.values() if entry.snapshot is not None]
+            stats = dict(
+                self._stats,
+                resident=len(resident),
+                spilled=len(self._entries) - len(resident),
+                resident_bytes=self.resident_bytes(),
+                memory_budget=self.memory_budget,
+            )
+        # Sizes only: /metrics is public and project ids grant access to a project
+        stats['largest_project_bytes'] = sorted(resident, reverse=True)[:5]
+        stats['blobs'] = self.blob_store.stats()
+        return stats
+
+    def resident_bytes(self):
+        """Approximate memory held by resident projects, counting shared contents once"""
+        return self._overhead_bytes + self.blob_store.total_bytes
+
+    def enforce_budget(self, keep=None):
+        """Spill least recently used projects until resident bytes fit the budget"""
+        if not self.memory_budget or not self.spill_dir:
+            return
+        with self._lock:
+            if self.resident_bytes() <= self.memory_budget:
+                return
+            candidates = sorted(
+                ((entry.last_access, project_id, entry) for project_id, entry in self._entries.items()
+                 if entry.snapshot is not None and project_id != keep),
+                key=lambda item: item[0]
+            )
+        for _, project_id, entry in candidates:
+            if self.resident_bytes() <= self.memory_budget:
+                return
+            # Skip projects that are being edited right now
+            if entry.lock.acquire(blocking=False):
+                try:
+                    self._spill(project_id, entry)
+                finally:
+                    entry.lock.release()
+
+    def spill_idle(self):
+        """Spill every project that has not been accessed for idle_seconds"""
+        if not self.idle_seconds or not self.spill_dir:
+            return
+        cutoff = time.monotonic() - self.idle_seconds
+        with self._lock:
+            idle = [(project_id, entry) for project_id, entry in self._entries.items()
+                    if entry.snapshot is not None and entry.last_access < cutoff]
+        for project_id, entry in idle:
+            if entry.lock.acquire(blocking=False):
+                try:
+                    if entry.last_access < cutoff:
+                        self._spill(project_id, entry)
+                finally:
+                    entry.lock.release()
+
+    def _resolved(self, project_id, entry, resolve):
+        """Apply resolve(snapshot, history), retrying if the project was spilled meanwhile"""
+        for attempt in range(3):
+            snapshot, history = self._read(project_id, entry)
+            try:
+                return resolve(snapshot, history)
+            except KeyError:
+                if attempt == 2:
+                    raise
+
+    def _read(self, project_id, entry):
+        """Snapshot and history of an entry, loading it from disk if it was spilled"""
+        entry.last_access = time.monotonic()
+        snapshot, history = entry.snapshot, entry.history
+        if snapshot is not None and history is not None:
+            return snapshot, history
+        with entry.lock:
+            self._ensure_resident(project_id, entry)
+            snapshot, history = entry.snapshot, entry.history
+        self.enforce_budget(keep=project_id)
+        return snapshot, history
+
+    def _grow(self, entry, overhead, content_bytes):
+        entry.overhead += overhead
+        entry.size += overhead + content_bytes
+        with self._lock:
+            self._overhead_bytes += overhead
+
+    def _spill_path(self, project_id):
+        return os.path.join(self.spill_dir, f'{project_id}.json.z')
+
+    def _spill(self, project_id, entry):
+        """Write a resident project to disk and drop it from memory (entry lock held)"""
+        if entry.snapshot is None:
+            return
+        # Each distinct content is written once, however many versions use it
+        blobs = {digest: self.blob_store.get(digest) for digest in entry.blobs}
+        payload = json.dumps({'snapshot': entry.snapshot, 'history': entry.history, 'blobs': blobs},
+                             separators=(',', ':'))
+        path = self._spill_path(project_id)
+        with open(os.open(path + '.tmp', os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'wb') as f:
+            f.write(zlib.compress(payload.encode('utf-8')))
+        os.replace(path + '.tmp', path)
+        entry.snapshot = None
+        entry.history = None
+        for digest in entry.blobs:
+            self.blob_store.release(digest)
+        entry.blobs = set()
+        with self._lock:
+            self._overhead_bytes -= entry.overhead
+            self._stats['spills'] += 1
+        entry.overhead = entry.size = 0
+
+    def _clear_spill_dir(self):
+        """Remove spill files from a previous process; their projects cannot be reached"""
+        for name in os.listdir(self.spill_dir):
+            if name.endswith(('.json.z', '.json.z.tmp')):
+                os.remove(os.path.join(self.spill_dir, name))
+
+    def _ensure_resident(self, project_id, entry):
+        """Load a spilled project back into memory (entry lock held)"""
+        entry.last_access = time.monotonic()
+        if entry.snapshot is not None:
+            return
+        path = self._spill_path(project_id)
+        with open(path, 'rb') as f:
+            data = json.loads(zlib.decompress(f.read()).decode('utf-8'))
+        entry.blobs = {self.blob_store.put(content, digest) for digest, content in data['blobs'].items()}
+        entry.history = tuple(data['history'])
+        entry.snapshot = data['snapshot']
+        os.remove(path)
+        overhead, content_bytes = _measure(entry, self.blob_store)
+        with self._lock:
+            self._overhead_bytes += overhead
+            self._stats['loads'] += 1
+        entry.overhead = overhead
+        entry.size = overhead + content_bytes
+
+    def _entry(self, project_id):
+        entry = self._entries.get(project_id)
+        if entry is None:
+            raise ProjectNotFoundError(project_id)
+        return entry
+
+    def _new_id(self, now):
+        # The random suffix keeps ids unique when projects are created in the same second
+        while True:
+            project_id = f"project_{now.strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+            if project_id not in self._entries:
+                return project_id
+
@@ -0,0 +1,36 @@
+import os
+import tempfile
+
+import pytest
+
+# app.py reads its configuration at import time: point it at the local fakes
+os.environ.update({
+    'FAKE_GEMINI': '1',
+    'FAKE_GEMINI_LATENCY': '0',
+    'FAKE_TRANSLATOR': '1',
+    'FAKE_TRANSLATOR_LATENCY': '0',
+    'FAKE_SPEECH': '1',
+    'FAKE_SPEECH_LATENCY': '0',
+    'PREFETCH_ENABLED': '',
+    'PROJECT_SPILL_DIR': tempfile.mkdtemp(prefix='v2c_test_spill_'),
+})
+
+
+@pytest.fixture
+def v2c():
+    import app
+    return app
+
+
+@pytest.fixture
+def client(v2c):
+    return v2c.app.test_client()
+
+
+@pytest.fixture
+def use_model(v2c, monkeypatch):
+    """Swap the model behind the app's LLM scheduler for this test"""
+    def use(model):
+        monkeypatch.setattr(v2c.llm, 'model', model)
+        return model
+    return use
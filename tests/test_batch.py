@@ -0,0 +1,110 @@
+import json
+import time
+
+from fake_backends import FakeGenerativeModel
+
+
+def batch(client, **payload):
+    return client.post('/batch', json=payload).json
+
+
+def by_id(results):
+    return {result['id']: result for result in results}
+
+
+def test_identical_operations_share_one_job(client, use_model):
+    model = use_model(FakeGenerativeModel())
+    data = batch(client, buffers={'main': {'code': 'print("dedupe")', 'language': 'python'}}, operations=[
+        {'id': 'a', 'op': 'explain', 'buffer': 'main'},
+        {'id': 'b', 'op': 'explain', 'code': 'print("dedupe")', 'language': 'python'},
+        {'id': 'c', 'op': 'format', 'buffer': 'main'},
+    ])
+
+    assert data['success']
+    assert (data['operations'], data['unique'], data['deduplicated']) == (3, 2, 1)
+    results = by_id(data['results'])
+    assert results['a']['explanation'] == results['b']['explanation']
+    assert results['c']['formatted_code'] == 'print("dedupe")'
+    assert model.calls == 1
+
+
+def test_operations_run_concurrently_with_per_operation_timeout(client, use_model):
+    use_model(FakeGenerativeModel(latency=0.3))
+    code = {'code': 'print("timeout")', 'language': 'python'}
+
+    start = time.perf_counter()
+    data = batch(client, buffers={'main': code}, operations=[
+        {'id': 'slow', 'op': 'bugs', 'buffer': 'main', 'timeout': 0.05},
+        {'id': 'explain', 'op': 'explain', 'buffer': 'main'},
+        {'id': 'describe', 'op': 'description', 'buffer': 'main'},
+    ])
+    elapsed = time.perf_counter() - start
+
+    results = by_id(data['results'])
+    assert results['slow']['success'] is False and results['slow']['timed_out']
+    assert results['explain']['success'] and results['describe']['success']
+    # The timed-out result comes back first, and the two calls overlap
+    assert data['results'][0]['id'] == 'slow'
+    assert elapsed < 0.55
+
+
+def test_bad_operations_fail_individually(client, use_model):
+    use_model(FakeGenerativeModel())
+    data = batch(client, buffers={'main': {'code': 'x = 1'}, 'bad': 'x = 2'}, operations=[
+        'explain',
+        {'id': 'unknown', 'op': 'compile', 'buffer': 'main'},
+        {'id': 'words', 'op': 'format', 'buffer': 'main', 'timeout': 'soon'},
+        {'id': 'zero', 'op': 'format', 'buffer': 'main', 'timeout': 0},
+        {'id': 'missing', 'op': 'format', 'buffer': 'nope'},
+        {'id': 'not-object', 'op': 'format', 'buffer': 'bad'},
+        {'id': 'ok', 'op': 'format', 'buffer': 'main'},
+    ])
+
+    assert data['success']
+    results = by_id(data['results'])
+    assert results[0]['error'] == 'Operation must be an object'
+    for op_id in ('unknown', 'words', 'zero', 'missing', 'not-object'):
+        assert results[op_id]['success'] is False, op_id
+    assert results['ok']['formatted_code'] == 'x = 1'
+
+
+def test_operations_must_be_a_list(client):
+    data = batch(client, operations='explain')
+    assert data['success'] is False
+
+
+def test_stream_emits_results_then_done(client, use_model):
+    use_model(FakeGenerativeModel(latency=0.05))
+    response = client.post('/batch', json={'stream': True, 'operations': [
+        {'id': 1, 'op': 'explain', 'code': 'print("stream")'},
+        {'id': 2, 'op': 'format', 'code': 'print("stream")'},
+        {'id': 3, 'op': 'nope'},
+    ]})
+
+    assert response.mimetype == 'application/x-ndjson'
+    events = [json.loads(line) for line in response.data.decode().splitlines()]
+    assert [e['event'] for e in events] == ['result', 'result', 'result', 'done']
+    # Errors first, then operations in completion order
+    assert [e['id'] for e in events[:3]] == [3, 2, 1]
+    assert events[-1]['unique'] == 2
+
+
+def test_batch_keeps_session_prefetches_and_context(client, v2c, use_model, monkeypatch):
+    use_model(FakeGenerativeModel(responder=lambda prompt: '```python\nprint("keep")\n```'))
+    monkeypatch.setitem(v2c.app.config, 'PREFETCH_ENABLED', True)
+    assert client.post('/generate_code', json={'text': 'prefetch me'}).json['success']
+    cancelled = v2c.prefetcher.stats()['cancelled']
+
+    data = batch(client, buffers={'a': {'code': 'a = 1'}, 'b': {'code': 'b = 2'}}, operations=[
+        {'id': 'a', 'op': 'bugs', 'buffer': 'a'},
+        {'id': 'b', 'op': 'explain', 'buffer': 'b'},
+    ])
+    assert all(result['success'] for result in data['results'])
+    assert v2c.prefetcher.stats()['cancelled'] == cancelled
+
+    # Without code, explain still uses the generated code and its prefetched result
+    served = v2c.prefetcher.stats()
+    served = served['hits'] + served['attached']
+    assert client.post('/explain_code', json={}).json['success']
+    stats = v2c.prefetcher.stats()
+    assert stats['hits'] + stats['attached'] == served + 1
@@ -0,0 +1,78 @@
+import threading
+import time
+
+from code_context import CodeContextStore, fit_to_budget
+from fake_backends import FakeContextCache, FakeGenerativeModel
+from llm_scheduler import LLMScheduler, INTERACTIVE
+
+
+def test_fit_to_budget_keeps_head_and_tail_lines():
+    code = '\n'.join(f'line {i}' for i in range(1000))
+    fitted, truncated = fit_to_budget(code, 100)
+    assert truncated
+    assert fitted.startswith('line 0\n') and fitted.endswith('line 999')
+    assert 'lines omitted' in fitted
+
+
+def test_fit_to_budget_cuts_single_huge_line_by_characters():
+    code = 'var a=1;' * 10000
+    fitted, truncated = fit_to_budget(code, 100)
+    assert truncated
+    assert fitted.startswith(code[:200]) and fitted.endswith(code[-200:])
+    assert 'characters omitted' in fitted
+    assert len(fitted) < 500
+
+
+def test_full_code_sends_untruncated_file():
+    model = FakeGenerativeModel()
+    store = CodeContextStore(LLMScheduler(model), max_tokens=100)
+    code = '\n'.join(f'line {i}' for i in range(1000))
+    context = store.register(code, 'python')
+    assert context.truncated
+
+    store.generate(context, 'explain', INTERACTIVE)
+    truncated_bytes = model.bytes_sent
+    store.generate(context, 'rewrite', INTERACTIVE, full_code=True)
+    assert model.bytes_sent - truncated_bytes > len(code)
+
+
+class FlakyCache(FakeContextCache):
+    def __init__(self, model, fail=False, delay=0.0):
+        super().__init__(model)
+        self.fail = fail
+        self.delay = delay
+        self.creates = 0
+
+    def create(self, prefix):
+        self.creates += 1
+        time.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError('cache unavailable')
+        return super().create(prefix)
+
+
+def test_failed_cache_create_backs_off():
+    model = FakeGenerativeModel()
+    cache = FlakyCache(model, fail=True)
+    store = CodeContextStore(LLMScheduler(model), cache, min_cache_tokens=1, cache_retry=60.0)
+    context = store.register('print(1)', 'python')
+
+    for _ in range(5):
+        store.generate(context, 'explain', INTERACTIVE)
+    assert cache.creates == 1
+    assert store.stats()['provider_cache_errors'] == 1
+
+
+def test_concurrent_first_use_creates_one_handle():
+    model = FakeGenerativeModel()
+    cache = FlakyCache(model, delay=0.05)
+    store = CodeContextStore(LLMScheduler(model), cache, min_cache_tokens=1)
+    context = store.register('print(1)', 'python')
+
+    threads = [threading.Thread(target=store.generate, args=(context, 'explain', INTERACTIVE)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert cache.creates == 1
+    assert store.stats()['provider_cached'] == 1
@@ -0,0 +1,136 @@
+import threading
+import time
+
+import pytest
+
+from fake_backends import FakeGenerativeModel, FakeRateLimitError
+from llm_scheduler import (LLMScheduler, LLMOverloadedError, CircuitOpenError, is_rate_limited,
+                           INTERACTIVE, NORMAL, BACKGROUND)
+
+
+def no_sleep(seconds):
+    pass
+
+
+def run_concurrently(scheduler, priorities):
+    """Issue one call per priority from its own thread; returns [(priority, outcome)]"""
+    results = []
+    lock = threading.Lock()
+
+    def call(priority):
+        try:
+            scheduler.generate('prompt', priority=priority)
+            outcome = 'ok'
+        except Exception as e:
+            outcome = type(e).__name__
+        with lock:
+            results.append((priority, outcome))
+
+    threads = [threading.Thread(target=call, args=(p,)) for p in priorities]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_throttling_storm_sheds_background_without_opening_breaker():
+    model = FakeGenerativeModel(latency=0.05, max_concurrency=3, seed=1)
+    scheduler = LLMScheduler(model, max_queued={NORMAL: 32, BACKGROUND: 8})
+
+    results = run_concurrently(scheduler, [INTERACTIVE, NORMAL, BACKGROUND] * 20)
+    stats = scheduler.stats()
+
+    assert stats['breaker_opened'] == 0
+    assert stats['breaker_rejected'] == 0
+    assert stats['breaker_state'] == 'closed'
+    assert all(outcome == 'ok' for priority, outcome in results if priority == INTERACTIVE)
+    assert all(outcome in ('ok', 'LLMOverloadedError') for _, outcome in results)
+    # AIMD holds the window near the upstream quota instead of retrying blindly
+    assert stats['throttled'] < 20
+    assert stats['concurrency_limit'] < scheduler.max_concurrency
+
+
+def test_exhausted_throttling_retries_do_not_open_breaker():
+    model = FakeGenerativeModel(rate_limit_rate=1.0, seed=1)
+    scheduler = LLMScheduler(model, max_retries=2, breaker_threshold=2, sleep=no_sleep)
+
+    for _ in range(5):
+        with pytest.raises(FakeRateLimitError):
+            scheduler.generate('prompt', priority=INTERACTIVE)
+
+    stats = scheduler.stats()
+    assert stats['breaker_state'] == 'closed'
+    assert stats['throttled'] == 15
+    assert stats['failed'] == 5
+
+
+def test_hard_failures_open_breaker_and_probe_closes_it():
+    now = [0.0]
+    model = FakeGenerativeModel(error_rate=1.0, seed=1)
+    scheduler = LLMScheduler(model, max_retries=0, breaker_threshold=3, breaker_cooldown=30.0,
+                             clock=lambda: now[0], sleep=no_sleep)
+
+    for _ in range(3):
+        with pytest.raises(ConnectionError):
+            scheduler.generate('prompt')
+    assert scheduler.stats()['breaker_state'] == 'open'
+    with pytest.raises(CircuitOpenError):
+        scheduler.generate('prompt', priority=INTERACTIVE)
+
+    now[0] += 31.0
+    model.error_rate = 0.0
+    assert scheduler.generate('prompt').text
+    assert scheduler.stats()['breaker_state'] == 'closed'
+
+
+def test_background_shed_when_queue_full():
+    release = threading.Event()
+
+    class BlockingModel:
+        def generate_content(self, prompt, **kwargs):
+            release.wait(5)
+            return FakeGenerativeModel().generate_content(prompt)
+
+    scheduler = LLMScheduler(BlockingModel(), initial_concurrency=1, max_concurrency=1,
+                             max_queued={BACKGROUND: 1})
+    holder = threading.Thread(target=scheduler.generate, args=('prompt',))
+    waiter = threading.Thread(target=scheduler.generate, args=('prompt',), kwargs={'priority': BACKGROUND})
+    holder.start()
+    while scheduler.stats()['in_flight'] == 0:
+        time.sleep(0.001)
+    waiter.start()
+    while scheduler.stats()['queued']['background'] == 0:
+        time.sleep(0.001)
+
+    with pytest.raises(LLMOverloadedError):
+        scheduler.generate('prompt', priority=BACKGROUND)
+    release.set()
+    holder.join()
+    waiter.join()
+    assert scheduler.stats()['shed'] == 1
+
+
+def test_only_quota_errors_count_as_rate_limited():
+    assert is_rate_limited(FakeRateLimitError('quota'))
+    assert is_rate_limited(RuntimeError('429 Resource has been exhausted (e.g. check quota).'))
+    assert not is_rate_limited(ValueError('Unexpected token at line 429'))
+    assert not is_rate_limited(RuntimeError('received 4290 bytes'))
+
+
+def test_retry_rejected_by_breaker_is_failed_and_chained():
+    model = FakeGenerativeModel(error_rate=1.0, seed=1)
+
+    def sleep(seconds):
+        # Another request fails meanwhile and opens the breaker
+        with pytest.raises(ConnectionError):
+            scheduler.generate('other', priority=BACKGROUND)
+
+    scheduler = LLMScheduler(model, max_retries=3, breaker_threshold=2, sleep=sleep)
+    with pytest.raises(CircuitOpenError) as excinfo:
+        scheduler.generate('prompt', priority=INTERACTIVE)
+
+    assert isinstance(excinfo.value.__cause__, ConnectionError)
+    stats = scheduler.stats()
+    assert stats['failed'] == 2
+    assert stats['requests'] == 2
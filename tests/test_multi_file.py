@@ -0,0 +1,89 @@
+import json
+import time
+
+import pytest
+
+from fake_backends import FakeGenerativeModel
+
+
+class PlannedModel(FakeGenerativeModel):
+    """Fake that answers the planning prompt with a given plan and sleeps per file"""
+
+    def __init__(self, plan, file_latency=None):
+        super().__init__(responder=self.respond)
+        self.plan = plan
+        self.file_latency = file_latency or {}
+
+    def respond(self, prompt):
+        if 'Do NOT write the file contents' in prompt:
+            return self.plan if isinstance(self.plan, str) else json.dumps(self.plan)
+        for filename, latency in self.file_latency.items():
+            if f'complete contents of {filename} ' in prompt:
+                time.sleep(latency)
+                return f'# {filename}\n'
+        return '# file\n'
+
+
+PLAN = {'is_multi_file': True, 'files': [
+    {'filename': 'main.py', 'purpose': 'Entry point', 'interface': 'def main() -> None'},
+    {'filename': 'utils.py', 'purpose': 'Helpers', 'interface': 'def helper() -> int'},
+    {'filename': 'models.py', 'purpose': 'Data', 'interface': 'class Item'},
+]}
+
+
+def test_files_generated_in_parallel_and_stored(client, v2c, use_model):
+    use_model(PlannedModel(PLAN, {'main.py': 0.3, 'utils.py': 0.3, 'models.py': 0.3}))
+
+    start = time.perf_counter()
+    data = client.post('/create_multi_file_project', json={'description': 'app'}).json
+    elapsed = time.perf_counter() - start
+
+    assert data['success'] and data['project_data']['is_multi_file']
+    assert sorted(f['filename'] for f in data['project_data']['files']) == ['main.py', 'models.py', 'utils.py']
+    # Close to the slowest file, not the sum of all three
+    assert elapsed < 0.75
+
+    project = v2c.project_registry.get(data['project_id'], with_content=True)
+    assert project['files']['utils.py']['content'] == '# utils.py'
+    assert len(v2c.project_registry.history(data['project_id'])) == 3
+
+
+def test_stream_emits_plan_files_then_done(client, use_model):
+    use_model(PlannedModel(PLAN, {'main.py': 0.2, 'utils.py': 0.0, 'models.py': 0.1}))
+
+    response = client.post('/create_multi_file_project', json={'description': 'app', 'stream': True})
+    assert response.mimetype == 'application/x-ndjson'
+    events = [json.loads(line) for line in response.data.decode().splitlines()]
+
+    assert [e['event'] for e in events] == ['plan', 'file', 'file', 'file', 'done']
+    # Files arrive in completion order
+    assert [e['filename'] for e in events[1:4]] == ['utils.py', 'models.py', 'main.py']
+    assert events[0]['project_id'] == events[-1]['project_id']
+
+
+@pytest.mark.parametrize('plan', [
+    'not json at all',
+    '["main.py", "utils.py"]',
+    {'is_multi_file': True, 'files': None},
+    {'is_multi_file': True, 'files': 'main.py'},
+    {'is_multi_file': False},
+])
+def test_unusable_plan_falls_back_to_single_file(client, use_model, plan):
+    use_model(PlannedModel(plan))
+    data = client.post('/create_multi_file_project', json={'description': 'app'}).json
+    assert data == {'success': True, 'project_data': {'is_multi_file': False}}
+
+
+def test_model_filenames_are_normalized(client, v2c, use_model):
+    use_model(PlannedModel({'is_multi_file': True, 'files': [
+        {'filename': '../../etc/passwd'},
+        {'filename': '/abs/main.py'},
+        {'filename': 'abs/main.py'},
+        {'filename': '..'},
+        {'filename': 'src/utils.py'},
+    ]}))
+
+    data = client.post('/create_multi_file_project', json={'description': 'app'}).json
+    files = sorted(f['filename'] for f in data['project_data']['files'])
+    assert files == ['abs/main.py', 'etc/passwd', 'src/utils.py']
+    assert sorted(v2c.project_registry.get(data['project_id'])['files']) == files
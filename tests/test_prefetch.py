@@ -0,0 +1,140 @@
+import threading
+import time
+
+from fake_backends import FakeGenerativeModel
+from llm_scheduler import LLMScheduler, INTERACTIVE, BACKGROUND
+from prefetch import Prefetcher
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.001)
+
+
+class GatedModel:
+    """Fake model whose calls block until the gate opens"""
+
+    def __init__(self):
+        self.gate = threading.Event()
+        self.prompts = []
+        self._model = FakeGenerativeModel()
+
+    def generate_content(self, prompt, **kwargs):
+        self.prompts.append(prompt)
+        self.gate.wait(5)
+        return self._model.generate_content(prompt)
+
+
+def test_interactive_get_does_not_wait_behind_queued_background_job():
+    model = GatedModel()
+    scheduler = LLMScheduler(model, initial_concurrency=1, max_concurrency=1)
+    prefetcher = Prefetcher(max_workers=2)
+
+    # Occupy the only slot so the prefetch sits in the scheduler's background queue
+    blocker = threading.Thread(target=scheduler.generate, args=('blocker',))
+    blocker.start()
+    wait_until(lambda: scheduler.stats()['in_flight'] == 1)
+    prefetcher.schedule('a', 'code', 'python', {
+        'explain': lambda c, l: scheduler.generate('prefetch', priority=BACKGROUND).text,
+    })
+    wait_until(lambda: scheduler.stats()['queued']['background'] == 1)
+
+    result = []
+    caller = threading.Thread(target=lambda: result.append(prefetcher.get(
+        'explain', 'code', 'python', lambda: scheduler.generate('inline', priority=INTERACTIVE).text, owner='a')))
+    caller.start()
+    wait_until(lambda: scheduler.stats()['queued']['interactive'] == 1)
+    model.gate.set()
+    caller.join(5)
+    blocker.join(5)
+
+    assert result
+    stats = prefetcher.stats()
+    assert stats['misses'] == 1 and stats['attached'] == 0 and stats['cancelled'] == 1
+    # The abandoned background job never reached upstream
+    wait_until(lambda: scheduler.stats()['queued']['background'] == 0)
+    assert 'prefetch' not in model.prompts
+
+
+def test_attaches_to_job_whose_upstream_call_started():
+    model = GatedModel()
+    scheduler = LLMScheduler(model)
+    prefetcher = Prefetcher()
+    prefetcher.schedule('a', 'code', 'python', {
+        'explain': lambda c, l: scheduler.generate('prefetch', priority=BACKGROUND).text,
+    })
+    wait_until(lambda: model.prompts == ['prefetch'])
+
+    result = []
+    caller = threading.Thread(target=lambda: result.append(prefetcher.get(
+        'explain', 'code', 'python', lambda: 'inline', owner='a')))
+    caller.start()
+    time.sleep(0.05)
+    model.gate.set()
+    caller.join(5)
+
+    assert result and result[0] != 'inline'
+    assert prefetcher.stats()['attached'] == 1
+
+
+def test_shared_prefetch_survives_one_owner_moving_on():
+    gate = threading.Event()
+    scheduler = LLMScheduler(FakeGenerativeModel())
+    prefetcher = Prefetcher(max_workers=1)
+    prefetcher.schedule('blocker', 'other', 'python', {'explain': lambda c, l: gate.wait(5)})
+    jobs = {'explain': lambda c, l: scheduler.generate('prefetch', priority=BACKGROUND).text}
+    prefetcher.schedule('a', 'code', 'python', jobs)
+    prefetcher.schedule('b', 'code', 'python', jobs)
+
+    # Session a edits its code; session b still wants the prefetch
+    prefetcher.schedule('a', 'new code', 'python', {})
+    gate.set()
+    wait_until(lambda: scheduler.stats()['succeeded'] == 1)
+    assert prefetcher.get('explain', 'code', 'python', lambda: 'inline', owner='b') != 'inline'
+
+    prefetcher.cancel('b')
+    assert prefetcher.stats()['cancelled'] == 0
+
+
+def test_cancel_counts_only_jobs_stopped_before_upstream():
+    gate = threading.Event()
+    started = threading.Event()
+
+    def running(code, language):
+        started.set()
+        gate.wait(5)
+
+    prefetcher = Prefetcher(max_workers=1)
+    prefetcher.schedule('a', 'code', 'python', {'explain': running, 'bugs': lambda c, l: 'x'})
+    started.wait(5)
+    # explain is running without a scheduler claim, bugs is still queued in the pool
+    prefetcher.cancel('a')
+    gate.set()
+    assert prefetcher.stats()['cancelled'] == 2
+
+    model = GatedModel()
+    scheduler = LLMScheduler(model)
+    prefetcher = Prefetcher()
+    prefetcher.schedule('a', 'code', 'python', {
+        'explain': lambda c, l: scheduler.generate('prefetch', priority=BACKGROUND).text,
+    })
+    wait_until(lambda: model.prompts == ['prefetch'])
+    prefetcher.cancel('a')
+    model.gate.set()
+    assert prefetcher.stats()['cancelled'] == 0
+
+
+def test_clients_can_only_opt_out_of_prefetch(client, v2c, use_model, monkeypatch):
+    use_model(FakeGenerativeModel(responder=lambda prompt: '```python\nprint("opt out")\n```'))
+    scheduled = v2c.prefetcher.stats()['scheduled']
+    monkeypatch.setitem(v2c.app.config, 'PREFETCH_ENABLED', False)
+    assert client.post('/generate_code', json={'text': 'add numbers', 'prefetch': True}).json['success']
+    assert v2c.prefetcher.stats()['scheduled'] == scheduled
+
+    monkeypatch.setitem(v2c.app.config, 'PREFETCH_ENABLED', True)
+    client.post('/generate_code', json={'text': 'add numbers', 'prefetch': False})
+    assert v2c.prefetcher.stats()['scheduled'] == scheduled
+    client.post('/generate_code', json={'text': 'add numbers'})
+    assert v2c.prefetcher.stats()['scheduled'] == scheduled + 3
@@ -0,0 +1,93 @@
+import threading
+import time
+
+import pytest
+
+from profiler import SamplingProfiler
+
+
+def busy(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def test_samples_tracked_request_with_spans():
+    profiler = SamplingProfiler(interval=0.001)
+    profiler.start(requests=1)
+    profiler.begin_request('generate_code', '/generate_code')
+    with profiler.span('llm.upstream'):
+        busy(0.05)
+    profiler.end_request()
+
+    report = profiler.report()
+    assert not report['active']
+    assert report['samples'] > 0
+    assert report['routes']['generate_code']['requests'] == 1
+    assert report['spans']['llm.upstream']['calls'] == 1
+    assert any(line.startswith('generate_code;') for line in profiler.collapsed().splitlines())
+
+
+def test_span_churn_does_not_stop_sampler():
+    profiler = SamplingProfiler(interval=0.0005)
+    profiler.start(duration=5)
+    stop = threading.Event()
+
+    def request():
+        profiler.begin_request('explain_code')
+        while not stop.is_set():
+            with profiler.span('translate'):
+                pass
+        profiler.end_request()
+
+    threads = [threading.Thread(target=request) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.2)
+    before = profiler.report(top=0)['samples']
+    time.sleep(0.2)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    # The sampler is still alive and counting
+    assert profiler.report(top=0)['samples'] > before
+    profiler.stop()
+
+
+def test_inactive_span_is_noop():
+    profiler = SamplingProfiler()
+    with profiler.span('format'):
+        pass
+    assert profiler.report()['spans'] == {}
+
+
+def test_start_rejects_bad_settings():
+    profiler = SamplingProfiler()
+    for settings in ({'requests': '5x'}, {'requests': 0}, {'requests': True}, {'duration': -1},
+                     {'interval': 'fast'}, {'interval': float('inf')}, {'route': 5}):
+        with pytest.raises(ValueError):
+            profiler.start(**settings)
+        assert not profiler.active
+
+    profiler.start(requests='2', interval='0.01')
+    assert profiler.active
+    profiler.stop()
+
+
+def test_admin_endpoints(client, v2c, monkeypatch):
+    monkeypatch.setitem(v2c.app.config, 'ADMIN_TOKEN', 'secret')
+    assert client.post('/admin/profile/stop', headers={'X-Admin-Token': 'é'}).status_code == 403
+    assert client.post('/admin/profile/stop', headers={'X-Admin-Token': 'wrong'}).status_code == 403
+
+    headers = {'X-Admin-Token': 'secret'}
+    response = client.post('/admin/profile/start', json={'requests': '-5'}, headers=headers)
+    assert response.json['success'] is False
+    assert client.post('/format_code', json={'code': 'x'}).json['success']
+
+    assert client.post('/admin/profile/start', json={'requests': 1}, headers=headers).json['success']
+    client.get('/admin/profile/report', headers=headers)
+    client.post('/format_code', json={'code': 'x'})
+    report = client.get('/admin/profile/report', headers=headers).json['profile']
+    assert not report['active']
+    assert report['routes'] == {'format_code': report['routes']['format_code']}
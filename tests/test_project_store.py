@@ -0,0 +1,139 @@
+import random
+import threading
+import time
+
+import pytest
+
+from project_store import ProjectRegistry, ProjectNotFoundError
+
+
+def run_stress(registry, threads=16, steps=200):
+    """Many threads adding files and rolling back across a few projects at once"""
+    project_ids = [registry.create(f'Project {i}', 'python')[0] for i in range(8)]
+    assert len(set(project_ids)) == len(project_ids)
+    errors = []
+    add_counts = []
+
+    def worker(seed):
+        rng = random.Random(seed)
+        adds = 0
+        try:
+            for _ in range(steps):
+                project_id = rng.choice(project_ids)
+                if rng.random() < 0.7:
+                    # Small content space so identical contents are shared across projects
+                    content = f'# {rng.randint(0, 200)}\n' * 200
+                    registry.add_file(project_id, f'file{rng.randint(0, 4)}.py', content, 'python')
+                    adds += 1
+                else:
+                    history = registry.history(project_id)
+                    if history:
+                        registry.rollback(project_id, rng.randrange(len(history)))
+                assert isinstance(registry.get(project_id)['files'], dict)
+        except Exception as e:
+            errors.append(e)
+        add_counts.append(adds)
+
+    workers = [threading.Thread(target=worker, args=(seed,)) for seed in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+
+    assert not errors, errors
+    assert sum(len(registry.history(project_id)) for project_id in project_ids) == sum(add_counts), \
+        'lost history entries'
+    for project_id in project_ids:
+        history = registry.history(project_id, with_content=True)
+        for filename, file_data in registry.get(project_id, with_content=True)['files'].items():
+            assert any(h['filename'] == filename and h['content'] == file_data['content'] for h in history)
+    return project_ids
+
+
+def assert_accounting_drains(registry):
+    """Once every project is spilled, no resident bytes or blobs may be left over"""
+    time.sleep(0.01)
+    registry.spill_idle()
+    stats = registry.stats()
+    assert stats['resident'] == 0
+    assert stats['resident_bytes'] == 0
+    assert stats['blobs']['blobs'] == 0
+
+
+def test_concurrent_edits_without_spilling(tmp_path):
+    registry = ProjectRegistry(idle_seconds=0.001, spill_dir=str(tmp_path))
+    run_stress(registry)
+    assert registry.stats()['spills'] == 0
+    assert_accounting_drains(registry)
+
+
+def test_concurrent_edits_with_budget_spills(tmp_path):
+    budget = 256 * 1024
+    registry = ProjectRegistry(memory_budget=budget, idle_seconds=0.001, spill_dir=str(tmp_path))
+    project_ids = run_stress(registry)
+    stats = registry.stats()
+    assert stats['spills'] > 0 and stats['loads'] > 0
+
+    registry.enforce_budget()
+    assert registry.resident_bytes() <= budget
+    assert_accounting_drains(registry)
+    # Spilled projects load back transparently
+    assert all(registry.history(project_id) for project_id in project_ids)
+
+
+def test_identical_contents_are_stored_once():
+    registry = ProjectRegistry()
+    first, _ = registry.create('A', 'python')
+    second, _ = registry.create('B', 'python')
+    registry.add_file(first, 'main.py', 'print(1)\n', 'python')
+    registry.add_file(second, 'other.py', 'print(1)\n', 'python')
+    registry.add_file(first, 'main.py', 'print(1)\n', 'python')
+
+    blobs = registry.stats()['blobs']
+    assert blobs['blobs'] == 1
+    assert blobs['bytes'] == len('print(1)\n')
+
+
+def test_rollback_and_unknown_project():
+    registry = ProjectRegistry()
+    project_id, _ = registry.create('A', 'python')
+    registry.add_file(project_id, 'main.py', 'v1', 'python')
+    registry.add_file(project_id, 'main.py', 'v2', 'python')
+
+    assert registry.rollback(project_id, 0)['content'] == 'v1'
+    assert registry.get(project_id, with_content=True)['files']['main.py']['content'] == 'v1'
+    with pytest.raises(IndexError):
+        registry.rollback(project_id, 5)
+    with pytest.raises(ProjectNotFoundError):
+        registry.add_file('project_missing', 'main.py', 'x', 'python')
+    assert registry.get('project_missing') is None
+
+
+def test_spill_dir_is_private_and_cleared_at_startup(tmp_path):
+    spill_dir = tmp_path / 'spill'
+    spill_dir.mkdir(mode=0o755)
+    (spill_dir / 'project_old.json.z').write_bytes(b'stale')
+    (spill_dir / 'notes.txt').write_text('keep')
+
+    registry = ProjectRegistry(idle_seconds=0.001, spill_dir=str(spill_dir))
+    assert spill_dir.stat().st_mode & 0o777 == 0o700
+    assert sorted(p.name for p in spill_dir.iterdir()) == ['notes.txt']
+
+    project_id, _ = registry.create('A', 'python')
+    registry.add_file(project_id, 'main.py', 'print(1)\n', 'python')
+    time.sleep(0.01)
+    registry.spill_idle()
+    assert (spill_dir / f'{project_id}.json.z').stat().st_mode & 0o777 == 0o600
+
+
+def test_default_spill_dir_without_user_name(monkeypatch):
+    import getpass
+    import os
+
+    from config import default_spill_dir
+
+    def no_user():
+        raise KeyError('getpwuid(): uid not found')
+
+    monkeypatch.setattr(getpass, 'getuser', no_user)
+    assert default_spill_dir().endswith(f'v2c_projects_{os.getuid()}')